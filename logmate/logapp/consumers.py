@@ -25,8 +25,21 @@
 #         }))
 
 
+import asyncio
 import json
+import logging
+import os
+import socket
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .live import live_stats
+
+logger = logging.getLogger(__name__)
+
+# Identifies this backend process in LIVE snapshots
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}"
 
 class LogStatusConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -68,3 +81,90 @@ class LogStatusConsumer(AsyncWebsocketConsumer):
         
         # Send the message to the WebSocket
         await self.send(text_data=json.dumps(message_data))
+
+
+class LogIngestConsumer(AsyncWebsocketConsumer):
+    """
+    Accepts a continuous stream of log lines from shipper processes.
+
+    Each text frame may carry one or more newline-separated lines. Lines are
+    folded into the process-wide sliding-window stats, and while at least one
+    shipper is connected a LIVE snapshot is broadcast to "livestats_group"
+    every LOGMATE_LIVE_PUBLISH_INTERVAL seconds.
+
+    The stats only cover the shippers connected to this process. With more
+    than one backend process every snapshot is partial; each carries the
+    process's "instance" id, so clients can keep the latest snapshot per
+    instance and sum them.
+    """
+    connections = 0
+    publisher = None
+
+    async def connect(self):
+        await self.accept()
+        cls = type(self)
+        cls.connections += 1
+        if cls.publisher is None or cls.publisher.done():
+            cls.publisher = asyncio.create_task(cls.publish_stats())
+
+    async def disconnect(self, close_code):
+        cls = type(self)
+        cls.connections -= 1
+        if cls.connections <= 0 and cls.publisher is not None:
+            cls.publisher.cancel()
+            cls.publisher = None
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if text_data is None:
+            text_data = bytes_data.decode('utf-8', errors='replace')
+        now = time.time()
+        add = live_stats.add
+        for line in text_data.splitlines():
+            if line:
+                add(line, now)
+
+    @staticmethod
+    async def publish_stats():
+        channel_layer = get_channel_layer()
+        interval = getattr(settings, 'LOGMATE_LIVE_PUBLISH_INTERVAL', 1.0)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await channel_layer.group_send(
+                    "livestats_group",
+                    {
+                        "type": "live_stats",
+                        "event": "LIVE",
+                        "instance": INSTANCE_ID,
+                        **live_stats.snapshot(),
+                    }
+                )
+            except Exception as e:
+                # Keep publishing; the next snapshot supersedes this one anyway
+                logger.error(f"Failed to publish live stats: {e}", exc_info=True)
+
+
+class LiveStatsConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes the LIVE sliding-window snapshots produced by LogIngestConsumer.
+
+    Kept apart from LogStatusConsumer, whose clients expect every message to
+    belong to an upload task.
+    """
+
+    async def connect(self):
+        await self.channel_layer.group_add(
+            "livestats_group",
+            self.channel_name
+        )
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(
+            "livestats_group",
+            self.channel_name
+        )
+
+    async def live_stats(self, event):
+        message_data = {k: v for k, v in event.items() if k != 'type'}
+        await self.send(text_data=json.dumps(message_data))
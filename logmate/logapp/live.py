@@ -0,0 +1,145 @@
+import heapq
+import time
+from collections import Counter
+from operator import itemgetter
+
+from .parser import parse_line
+from .paths import get_path_normalizer
+
+# Sliding windows kept for live ingestion, in seconds (1, 5 and 15 minutes)
+WINDOWS = (60, 300, 900)
+
+
+class _Counts:
+    """Request count plus status and path frequencies."""
+
+    __slots__ = ('requests', 'statuses', 'paths')
+
+    def __init__(self):
+        self.requests = 0
+        self.statuses = Counter()
+        self.paths = Counter()
+
+    def add(self, status, path):
+        self.requests += 1
+        self.statuses[status] += 1
+        self.paths[path] += 1
+
+    def subtract(self, other):
+        self.requests -= other.requests
+        for counter, expired in ((self.statuses, other.statuses), (self.paths, other.paths)):
+            for key, count in expired.items():
+                remaining = counter[key] - count
+                if remaining:
+                    counter[key] = remaining
+                else:
+                    # Drop zero entries so the key set stays bounded by the window
+                    del counter[key]
+
+
+class _Bucket(_Counts):
+    __slots__ = ('second',)
+
+    def __init__(self):
+        super().__init__()
+        self.second = None
+
+
+class _Window(_Counts):
+    __slots__ = ('seconds',)
+
+    def __init__(self, seconds):
+        super().__init__()
+        self.seconds = seconds
+
+
+class SlidingWindowStats:
+    """
+    Sliding-window aggregates over a stream of log lines.
+
+    Lines are counted into one-second buckets held in a ring buffer as long as
+    the largest window. Each window keeps running totals: a line is added to
+    every window on arrival, and a bucket is subtracted from a window once as
+    it ages out. The per-line cost is therefore constant, and top-N is only
+    computed when a snapshot is taken.
+    """
+
+    def __init__(self, windows=WINDOWS, normalize_path=None):
+        self.normalize_path = normalize_path or get_path_normalizer()
+        self.size = max(windows)
+        self.buckets = [_Bucket() for _ in range(self.size)]
+        self.windows = [_Window(seconds) for seconds in sorted(windows)]
+        self.head = None
+        self.started = None
+
+    def advance(self, second):
+        """Move the ring buffer forward to the given second, expiring old buckets."""
+        if self.head is None:
+            self.head = self.started = second
+            self.buckets[second % self.size].second = second
+            return
+        if second <= self.head:
+            return
+
+        if second - self.head >= self.size:
+            # Everything has aged out of every window
+            self.buckets = [_Bucket() for _ in range(self.size)]
+            self.windows = [_Window(window.seconds) for window in self.windows]
+            self.head = self.started = second
+            self.buckets[second % self.size].second = second
+            return
+
+        for current in range(self.head + 1, second + 1):
+            for window in self.windows:
+                expired = current - window.seconds
+                bucket = self.buckets[expired % self.size]
+                if bucket.second == expired:
+                    window.subtract(bucket)
+            # The slot being reused held the bucket that just left the largest window
+            bucket = _Bucket()
+            bucket.second = current
+            self.buckets[current % self.size] = bucket
+        self.head = second
+
+    def add(self, line, now=None):
+        """
+        Count a single log line at arrival time now (defaults to time.time()).
+
+        Returns False if the line could not be parsed.
+        """
+        second = int(time.time() if now is None else now)
+        self.advance(second)
+
+        parsed = parse_line(line)
+        if not parsed:
+            return False
+        status, path = parsed[3], self.normalize_path(parsed[2])
+
+        # Late arrivals are counted in the current bucket
+        self.buckets[self.head % self.size].add(status, path)
+        for window in self.windows:
+            window.add(status, path)
+        return True
+
+    def snapshot(self, now=None, top_n=5):
+        """Return the current aggregates for every window."""
+        if self.head is not None:
+            self.advance(int(time.time() if now is None else now))
+
+        windows = {}
+        for window in self.windows:
+            # Before the window has filled, rate is measured over the time seen so far
+            span = window.seconds
+            if self.head is not None:
+                span = min(span, self.head - self.started + 1)
+            windows[f"{window.seconds // 60}m"] = {
+                "requests": window.requests,
+                "requestRate": window.requests / span,
+                "statusCount": dict(window.statuses),
+                "topPaths": heapq.nlargest(top_n, window.paths.items(), key=itemgetter(1)),
+            }
+        return {"windows": windows}
+
+
+# Shared by every ingestion connection served by this process
+live_stats = SlidingWindowStats()
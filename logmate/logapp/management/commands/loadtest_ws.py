@@ -0,0 +1,176 @@
+import asyncio
+import json
+import resource
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+
+# One synthetic task broadcasts START, five CHUNKs and COMPLETE, like process_log
+TOTAL_CHUNKS = 5
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def synthetic_event(seq):
+    """Build the seq-th event of an endless stream of synthetic tasks."""
+    task_number, step = divmod(seq, TOTAL_CHUNKS + 2)
+    event = {
+        "type": "log_status",
+        "task_id": f"loadtest-{task_number}",
+        "fileName": f"loadtest-{task_number}.log",
+        "fileSize": 1024 * 1024,
+        "seq": seq,
+    }
+    if step == 0:
+        event.update(event="START", totalLines=10000, totalChunks=TOTAL_CHUNKS)
+    elif step <= TOTAL_CHUNKS:
+        event.update(
+            event="CHUNK",
+            chunkIndex=step,
+            totalChunks=TOTAL_CHUNKS,
+            processedCount=step * 2000,
+            totalLines=10000,
+        )
+    else:
+        event.update(event="COMPLETE", result={
+            "lineCount": 10000,
+            "methodsCount": {"GET": 7000, "POST": 3000},
+            "statusCount": {"200": 9000, "404": 1000},
+            "totalBytes": 5120000,
+            "topPaths": [["/", 5000], ["/api/v1/users", 3000], ["/login", 2000]],
+            "topIPs": [["10.0.0.1", 100]],
+            "topUserAgents": [["curl/7.68.0", 10000]],
+        })
+    return event
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test WebSocket fan-out: connect N in-process clients to ws/logstatus/ "
+        "on logmate.asgi, broadcast synthetic START/CHUNK/COMPLETE events at a fixed "
+        "rate and report delivery latency, dropped messages and CPU usage."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100, help='Number of simulated dashboards')
+        parser.add_argument('--rate', type=float, default=20.0, help='Broadcast events per second')
+        parser.add_argument('--events', type=int, default=140, help='Total events to broadcast')
+        parser.add_argument('--drain', type=float, default=5.0,
+                            help='Seconds to wait for outstanding deliveries after the last send')
+        parser.add_argument('--layer', choices=['memory', 'redis'], default='memory',
+                            help='Channel layer to run against')
+        parser.add_argument('--capacity', type=int, default=100,
+                            help='Per-channel capacity; full channels drop messages')
+        parser.add_argument('--redis-url', default='redis://localhost:6379/0',
+                            help='Redis to use with --layer redis')
+
+    def handle(self, *args, **options):
+        for name in ('clients', 'rate', 'events', 'capacity'):
+            if options[name] <= 0:
+                raise CommandError(f"--{name} must be positive")
+        if options['drain'] < 0:
+            raise CommandError("--drain must not be negative")
+
+        if options['layer'] == 'memory':
+            layer = {
+                'BACKEND': 'channels.layers.InMemoryChannelLayer',
+                'CONFIG': {'capacity': options['capacity']},
+            }
+        else:
+            layer = {
+                'BACKEND': 'channels_redis.core.RedisChannelLayer',
+                'CONFIG': {'hosts': [options['redis_url']], 'capacity': options['capacity']},
+            }
+
+        with override_settings(CHANNEL_LAYERS={'default': layer}):
+            report = asyncio.run(self.run_load(options))
+
+        latencies = report['latencies']
+        self.stdout.write(f"layer:              {options['layer']} (capacity {options['capacity']})")
+        self.stdout.write(f"clients connected:  {report['clients']}")
+        self.stdout.write(f"events sent:        {report['sent']} in {report['send_seconds']:.2f}s "
+                          f"({report['sent'] / max(report['send_seconds'], 1e-9):.1f}/s)")
+        self.stdout.write(f"deliveries:         {report['delivered']} / {report['expected']}")
+        self.stdout.write(f"dropped:            {report['dropped']} "
+                          f"({100 * report['dropped'] / max(report['expected'], 1):.2f}%)")
+        self.stdout.write(
+            "latency ms:         "
+            f"p50={percentile(latencies, 50):.2f} p90={percentile(latencies, 90):.2f} "
+            f"p99={percentile(latencies, 99):.2f} max={percentile(latencies, 100):.2f}"
+        )
+        self.stdout.write(f"cpu:                {report['cpu_seconds']:.2f}s over {report['wall_seconds']:.2f}s "
+                          f"({100 * report['cpu_seconds'] / max(report['wall_seconds'], 1e-9):.0f}% of one core, "
+                          "clients included)")
+
+    async def run_load(self, options):
+        # Imported here so the application picks up the overridden channel layer
+        from logmate.asgi import application
+
+        clients = [WebsocketCommunicator(application, '/ws/logstatus/') for _ in range(options['clients'])]
+        results = await asyncio.gather(*(client.connect() for client in clients))
+        connected = [client for client, (ok, _) in zip(clients, results) if ok]
+
+        latencies = []
+        delivered = 0
+        expected = len(connected) * options['events']
+        all_delivered = asyncio.Event()
+        if not expected:
+            all_delivered.set()
+
+        async def read(client):
+            nonlocal delivered
+            while True:
+                message = json.loads(await client.receive_from(timeout=None))
+                latencies.append((time.perf_counter() - message['sentAt']) * 1000)
+                delivered += 1
+                if delivered == expected:
+                    all_delivered.set()
+
+        readers = [asyncio.create_task(read(client)) for client in connected]
+        channel_layer = get_channel_layer()
+
+        usage_start = resource.getrusage(resource.RUSAGE_SELF)
+        wall_start = time.perf_counter()
+        for seq in range(options['events']):
+            # Pace against the schedule so slow sends don't lower the offered rate
+            delay = wall_start + seq / options['rate'] - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            event = synthetic_event(seq)
+            event['sentAt'] = time.perf_counter()
+            await channel_layer.group_send("logstatus_group", event)
+        send_seconds = time.perf_counter() - wall_start
+
+        try:
+            await asyncio.wait_for(all_delivered.wait(), timeout=options['drain'])
+        except asyncio.TimeoutError:
+            pass
+        wall_seconds = time.perf_counter() - wall_start
+        usage_end = resource.getrusage(resource.RUSAGE_SELF)
+
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        await asyncio.gather(*(client.disconnect() for client in connected), return_exceptions=True)
+
+        return {
+            'clients': len(connected),
+            'sent': options['events'],
+            'send_seconds': send_seconds,
+            'expected': expected,
+            'delivered': delivered,
+            'dropped': expected - delivered,
+            'latencies': sorted(latencies),
+            'wall_seconds': wall_seconds,
+            'cpu_seconds': (usage_end.ru_utime - usage_start.ru_utime)
+                           + (usage_end.ru_stime - usage_start.ru_stime),
+        }
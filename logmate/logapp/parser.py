@@ -0,0 +1,44 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def parse_line(line):
+    """
+    Parse a single log line.
+
+    Expected format:
+    {ip} - - [DATE] "METHOD PATH PROTOCOL" STATUS BYTES "-" "USER_AGENT"
+
+    Returns:
+      (ip, method, path, status, bytes_sent, user_agent) or None if parsing fails.
+    """
+    try:
+        # Split first to get IP address
+        ip = line.split()[0]
+
+        # Split the line by the double-quote character.
+        parts = line.split('"')
+        if len(parts) < 3:
+            return None
+
+        request_part = parts[1].strip()  # e.g., GET /api/v1/orders HTTP/1.1
+        status_part = parts[2].strip()   # e.g., 200 1234 - 
+        user_agent = parts[3].strip() if len(parts) > 3 else "Unknown"
+
+        request_fields = request_part.split()
+        if len(request_fields) < 2:
+            return None
+        method = request_fields[0]
+        path = request_fields[1]
+
+        status_fields = status_part.split()
+        if len(status_fields) < 2:
+            return None
+        status = status_fields[0]
+        bytes_sent = int(status_fields[1])
+        
+        return ip, method, path, status, bytes_sent, user_agent
+    except Exception as e:
+        logger.error(f"Failed to parse line: {line}. Error: {e}")
+        return None
@@ -0,0 +1,100 @@
+import functools
+import hashlib
+import json
+import re
+
+from django.conf import settings
+
+UUID_RE = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+NUMBER_RE = re.compile(r'^\d+$')
+# Hex digests and similar opaque tokens (md5, sha1, object ids, ...)
+HASH_RE = re.compile(r'^[0-9a-fA-F]{16,}$')
+PLACEHOLDER_RE = re.compile(r'\{[^/{}]+\}')
+
+
+def compile_template(template):
+    """
+    Compile a route template such as "/api/v1/users/{id}/orders" to a regex.
+
+    Each {placeholder} matches exactly one path segment.
+    """
+    pattern = ''
+    position = 0
+    for match in PLACEHOLDER_RE.finditer(template):
+        pattern += re.escape(template[position:match.start()]) + '[^/]+'
+        position = match.end()
+    pattern += re.escape(template[position:])
+    return re.compile(pattern)
+
+
+class PathNormalizer:
+    """
+    Collapses high-cardinality request paths before they are counted.
+
+    Query strings are stripped, and paths matching a user-defined route
+    template are reported as that template. Otherwise numeric segments,
+    UUIDs and long hex tokens become {id}, {uuid} and {hash}. Results are
+    memoised in a bounded LRU cache keyed by the raw path, so repeated paths
+    cost one dict lookup.
+    """
+
+    def __init__(self, templates=(), cache_size=100000):
+        self.templates = [(compile_template(template), template) for template in templates]
+        self.normalize = functools.lru_cache(maxsize=cache_size)(self._normalize)
+
+    def _normalize(self, path):
+        path = path.split('?', 1)[0].split('#', 1)[0]
+
+        for regex, template in self.templates:
+            if regex.fullmatch(path):
+                return template
+
+        segments = path.split('/')
+        for index, segment in enumerate(segments):
+            if not segment:
+                continue
+            if NUMBER_RE.match(segment):
+                segments[index] = '{id}'
+            elif UUID_RE.match(segment):
+                segments[index] = '{uuid}'
+            elif HASH_RE.match(segment):
+                segments[index] = '{hash}'
+        return '/'.join(segments)
+
+
+def _unchanged(path):
+    return path
+
+
+@functools.lru_cache(maxsize=4)
+def _build_normalizer(templates, cache_size):
+    return PathNormalizer(templates, cache_size)
+
+
+def get_path_normalizer():
+    """
+    Return the path normalization callable configured in settings.
+
+    The normalizer, and with it the memo cache, is shared for as long as the
+    settings stay the same, so it stays warm across tasks in a worker.
+    """
+    if not getattr(settings, 'LOGMATE_PATH_NORMALIZATION', True):
+        return _unchanged
+    templates = tuple(getattr(settings, 'LOGMATE_PATH_TEMPLATES', ()))
+    cache_size = getattr(settings, 'LOGMATE_PATH_CACHE_SIZE', 100000)
+    return _build_normalizer(templates, cache_size).normalize
+
+
+def path_normalization_key():
+    """
+    Return a short fingerprint of the settings that change normalized paths.
+
+    Anything cached from normalized results (e.g. task results) must include
+    it, so changing LOGMATE_PATH_NORMALIZATION or LOGMATE_PATH_TEMPLATES
+    never serves paths counted under the old configuration.
+    """
+    config = [
+        bool(getattr(settings, 'LOGMATE_PATH_NORMALIZATION', True)),
+        list(getattr(settings, 'LOGMATE_PATH_TEMPLATES', ())),
+    ]
+    return hashlib.sha256(json.dumps(config).encode()).hexdigest()[:16]
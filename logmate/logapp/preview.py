@@ -0,0 +1,129 @@
+import heapq
+import math
+import random
+from collections import Counter
+
+from .parser import parse_line
+
+
+def _ratio_estimate(counts, sizes, file_size, sampled_fraction, z):
+    """
+    Extrapolate a total from per-block counts, with a confidence interval.
+
+    Uses the ratio estimator count/bytes over the sampled blocks, scaled by
+    the file size. Blocks are treated as clusters, so the variance comes from
+    how much the ratio differs between blocks rather than assuming lines are
+    independent, and it includes the finite population correction.
+    """
+    total_bytes = sum(sizes)
+    ratio = sum(counts) / total_bytes
+    estimate = ratio * file_size
+
+    blocks = len(sizes)
+    if sampled_fraction >= 1:
+        # The whole file was read, so the count is exact
+        margin = 0
+    elif blocks > 1:
+        mean_size = total_bytes / blocks
+        residuals = sum((count - ratio * size) ** 2 for count, size in zip(counts, sizes))
+        variance = (1 - sampled_fraction) * residuals / (blocks * (blocks - 1) * mean_size ** 2)
+        margin = z * math.sqrt(variance) * file_size
+    else:
+        margin = estimate
+
+    return {
+        "estimate": round(estimate),
+        "low": max(0, math.floor(estimate - margin)),
+        "high": math.ceil(estimate + margin),
+    }
+
+
+def sample_preview(log_file_path, file_size, blocks=32, block_size=64 * 1024,
+                   normalize_path=None, top_n=3, z=1.96, seed=None):
+    """
+    Estimate the final statistics from a small sample of the file.
+
+    The file is split into `blocks` equal strata and one block_size read is
+    taken at a random offset within each, trimmed to whole lines. Counts are
+    extrapolated to the whole file with roughly 95% confidence intervals
+    (z=1.96). Returns None if the sample holds no complete lines.
+
+    A file no larger than blocks * block_size is read in full instead, as
+    the blocks would overlap; the counts are then exact.
+    """
+    if file_size <= blocks * block_size:
+        blocks, block_size = 1, file_size
+    rng = random.Random(seed)
+    stride = file_size / blocks
+    normalize_path = normalize_path or (lambda path: path)
+
+    sizes = []
+    line_counts = []
+    byte_sums = []
+    methods = []
+    statuses = []
+    paths = []
+    with open(log_file_path, 'rb') as f:
+        for index in range(blocks):
+            start = int(index * stride)
+            offset = start + rng.randrange(max(1, int(stride) - block_size))
+            f.seek(offset)
+            data = f.read(block_size)
+
+            # Align to whole lines: skip the partial first line unless the
+            # block starts the file, and the partial last line unless it ends it
+            if offset > 0:
+                newline = data.find(b'\n')
+                data = data[newline + 1:] if newline >= 0 else b''
+            if offset + block_size < file_size:
+                data = data[:data.rfind(b'\n') + 1]
+
+            block_methods = Counter()
+            block_statuses = Counter()
+            block_paths = Counter()
+            lines = 0
+            bytes_sent = 0
+            for line in data.decode('utf-8', errors='replace').splitlines():
+                lines += 1
+                parsed = parse_line(line)
+                if not parsed:
+                    continue
+                ip, method, path, status, sent, user_agent = parsed
+                block_methods[method] += 1
+                block_statuses[status] += 1
+                block_paths[normalize_path(path)] += 1
+                bytes_sent += sent
+
+            sizes.append(len(data))
+            line_counts.append(lines)
+            byte_sums.append(bytes_sent)
+            methods.append(block_methods)
+            statuses.append(block_statuses)
+            paths.append(block_paths)
+
+    sampled_bytes = sum(sizes)
+    if not sampled_bytes:
+        return None
+    sampled_fraction = min(1.0, sampled_bytes / file_size)
+
+    def estimate(counts):
+        return _ratio_estimate(counts, sizes, file_size, sampled_fraction, z)
+
+    def estimate_each(block_counters):
+        keys = set().union(*block_counters)
+        return {key: estimate([counter[key] for counter in block_counters]) for key in keys}
+
+    path_totals = sum(paths, Counter())
+    top_paths = heapq.nlargest(top_n, path_totals, key=path_totals.get)
+
+    return {
+        "blocks": blocks,
+        "sampledBytes": sampled_bytes,
+        "sampledLines": sum(line_counts),
+        "confidence": round(math.erf(z / math.sqrt(2)), 3),
+        "lineCount": estimate(line_counts),
+        "totalBytes": estimate(byte_sums),
+        "methodsCount": estimate_each(methods),
+        "statusCount": estimate_each(statuses),
+        "topPaths": [[path, estimate([counter[path] for counter in paths])] for path in top_paths],
+    }
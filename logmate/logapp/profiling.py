@@ -0,0 +1,42 @@
+import sys
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """
+    Accumulates wall-clock time, CPU time and allocations per named stage.
+
+    A stage may be entered many times (e.g. once per chunk); the totals and
+    the number of calls are reported. Allocations are the net change in live
+    interpreter memory blocks (sys.getallocatedblocks), which is cheap enough
+    to leave on for every task.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        blocks_start = sys.getallocatedblocks()
+        try:
+            yield
+        finally:
+            totals = self.stages.setdefault(name, [0.0, 0.0, 0, 0])
+            totals[0] += time.perf_counter() - wall_start
+            totals[1] += time.process_time() - cpu_start
+            totals[2] += sys.getallocatedblocks() - blocks_start
+            totals[3] += 1
+
+    def as_dict(self):
+        return {
+            name: {
+                "wallMs": round(wall * 1000, 3),
+                "cpuMs": round(cpu * 1000, 3),
+                "allocatedBlocks": blocks,
+                "calls": calls,
+            }
+            for name, (wall, cpu, blocks, calls) in self.stages.items()
+        }
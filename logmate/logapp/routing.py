@@ -9,10 +9,12 @@
 
 from django.urls import path
 from channels.routing import ProtocolTypeRouter, URLRouter
-from logapp.consumers import LogStatusConsumer
+from logapp.consumers import LogStatusConsumer, LogIngestConsumer, LiveStatsConsumer
 
 websocket_urlpatterns = [
     path('ws/logstatus/', LogStatusConsumer.as_asgi()),
+    path('ws/ingest/', LogIngestConsumer.as_asgi()),
+    path('ws/livestats/', LiveStatsConsumer.as_asgi()),
 ]
 
 application = ProtocolTypeRouter({
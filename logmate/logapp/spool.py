@@ -0,0 +1,236 @@
+import fcntl
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SpoolFull(Exception):
+    """Raised when an upload cannot fit in the spool quota, even after eviction."""
+
+
+class UploadSpool:
+    """
+    Managed directory for uploaded logs, shared by the web and worker processes.
+
+    Completed uploads are stored content-addressed as <sha256>.log, so identical
+    uploads share one file. Every queued task holds a reference on its file and
+    the file is deleted when the last reference is released. Uploads in flight
+    live under incoming/ with unique names, chunked uploads under chunked/,
+    and opt-in profiler dumps as .prof files next to the logs. All of it
+    counts towards LOGMATE_SPOOL_QUOTA_BYTES.
+
+    Bookkeeping is guarded by an flock on <root>/.lock, which works across the
+    backend and worker containers sharing the volume.
+    """
+
+    def __init__(self, root=None, quota=None):
+        self.root = root or settings.LOGMATE_SPOOL_DIR
+        self.quota = quota if quota is not None else settings.LOGMATE_SPOOL_QUOTA_BYTES
+        self.stale_seconds = getattr(settings, 'LOGMATE_SPOOL_STALE_SECONDS', 24 * 60 * 60)
+        self.incoming_dir = os.path.join(self.root, 'incoming')
+        self.chunked_dir = os.path.join(self.root, 'chunked')
+        os.makedirs(self.incoming_dir, exist_ok=True)
+        os.makedirs(self.chunked_dir, exist_ok=True)
+
+    @contextmanager
+    def _lock(self):
+        with open(os.path.join(self.root, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def blob_path(self, sha256):
+        return os.path.join(self.root, f"{sha256}.log")
+
+    def _refs_path(self, sha256):
+        return os.path.join(self.root, f"{sha256}.refs")
+
+    def incoming_path(self):
+        return os.path.join(self.incoming_dir, f"{uuid.uuid4().hex}.part")
+
+    def _read_refs(self, sha256):
+        try:
+            with open(self._refs_path(sha256)) as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_refs(self, sha256, refs):
+        if refs > 0:
+            with open(self._refs_path(sha256), 'w') as f:
+                f.write(str(refs))
+        elif os.path.exists(self._refs_path(sha256)):
+            os.remove(self._refs_path(sha256))
+
+    def _entries(self):
+        """Yield (path, stat, kind) for every file that counts towards the quota."""
+        for directory, kind in ((self.root, 'blob'), (self.incoming_dir, 'incoming'),
+                                (self.chunked_dir, 'chunked')):
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if not entry.is_file():
+                        continue
+                    entry_kind = kind
+                    if kind == 'blob':
+                        if entry.name.endswith('.prof'):
+                            entry_kind = 'profile'
+                        elif not entry.name.endswith('.log'):
+                            continue
+                    elif entry.name.endswith('.json'):
+                        # Reservation sidecars are counted by _pending()
+                        continue
+                    try:
+                        yield entry.path, entry.stat(), entry_kind
+                    except FileNotFoundError:
+                        continue
+
+    def _pending(self):
+        """
+        Yield (meta_path, stat, unwritten) for every reserved upload.
+
+        An upload in incoming/ or chunked/ declares its size in a <id>.json
+        sidecar; whatever its <id>.part does not hold yet still counts towards
+        the quota, so concurrent uploads cannot all pass the same check.
+        """
+        for directory in (self.incoming_dir, self.chunked_dir):
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.json'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                        with open(entry.path) as f:
+                            declared = json.load(f)['file_size']
+                    except (FileNotFoundError, ValueError, KeyError):
+                        continue
+                    try:
+                        written = os.path.getsize(entry.path[:-len('.json')] + '.part')
+                    except FileNotFoundError:
+                        written = 0
+                    yield entry.path, stat, max(0, declared - written)
+
+    def usage(self):
+        return (sum(stat.st_size for _, stat, _ in self._entries())
+                + sum(unwritten for _, _, unwritten in self._pending()))
+
+    def reserve(self, nbytes, directory=None):
+        """
+        Make room for an upload of nbytes, evicting if necessary.
+
+        The space is recorded as a <id>.json sidecar in directory (incoming/
+        by default) and the upload's data is expected in <id>.part next to it;
+        the new upload id is returned. The reservation ends when the file is
+        stored or discard() is called.
+
+        Unreferenced blobs are evicted least recently used first, along with
+        incoming and chunked uploads and profiler dumps that have been idle
+        longer than LOGMATE_SPOOL_STALE_SECONDS. Blobs whose reference count
+        has not changed for that long are treated as unreferenced, since the
+        tasks holding them were lost. Raises SpoolFull if that is not enough.
+        """
+        directory = directory or self.incoming_dir
+        with self._lock():
+            entries = list(self._entries())
+            pending = {path[:-len('.json')]: (stat, unwritten)
+                       for path, stat, unwritten in self._pending()}
+            used = (sum(stat.st_size for _, stat, _ in entries)
+                    + sum(unwritten for _, unwritten in pending.values()))
+
+            if used + nbytes > self.quota:
+                used = self._evict(entries, pending, used, self.quota - nbytes)
+            if used + nbytes > self.quota:
+                raise SpoolFull(f"Upload spool is full ({used} of {self.quota} bytes in use)")
+
+            upload_id = uuid.uuid4().hex
+            with open(os.path.join(directory, f"{upload_id}.json"), 'w') as f:
+                json.dump({'file_size': nbytes}, f)
+            return upload_id
+
+    def _evict(self, entries, pending, used, target):
+        """Evict candidates, oldest first, until used <= target. Returns the new usage."""
+        stale_before = time.time() - self.stale_seconds
+        candidates = []
+        for path, stat, kind in entries:
+            if kind == 'blob':
+                sha256 = os.path.basename(path)[:-len('.log')]
+                refs_path = self._refs_path(sha256)
+                try:
+                    # References untouched for that long were left by killed tasks
+                    orphaned = os.path.getmtime(refs_path) < stale_before
+                except FileNotFoundError:
+                    orphaned = True
+                if orphaned:
+                    candidates.append((stat.st_mtime, [path, refs_path], stat.st_size))
+            elif stat.st_mtime < stale_before:
+                base, ext = os.path.splitext(path)
+                if ext == '.part' and base in pending:
+                    # Abandoned upload: its reservation goes with it
+                    _, unwritten = pending.pop(base)
+                    candidates.append((stat.st_mtime, [path, base + '.json'], stat.st_size + unwritten))
+                else:
+                    candidates.append((stat.st_mtime, [path], stat.st_size))
+        for base, (stat, unwritten) in pending.items():
+            # Reservations whose upload never started writing, e.g. after a crash
+            if stat.st_mtime < stale_before and not os.path.exists(base + '.part'):
+                candidates.append((stat.st_mtime, [base + '.json'], unwritten))
+
+        for _, paths, size in sorted(candidates):
+            if used <= target:
+                break
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+            logger.info(f"Evicted {paths[0]} ({size} bytes) from upload spool")
+            used -= size
+        return used
+
+    def discard(self, upload_id, directory=None):
+        """Drop a reservation along with anything written for it."""
+        base = os.path.join(directory or self.incoming_dir, upload_id)
+        with self._lock():
+            for path in (base + '.part', base + '.json'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def store(self, temp_path, sha256):
+        """
+        Move a completed upload into the spool and take a reference on it.
+
+        If identical content is already spooled the new copy is discarded.
+        The upload's reservation, if any, ends here. Returns
+        (blob_path, deduplicated).
+        """
+        blob_path = self.blob_path(sha256)
+        meta_path = os.path.splitext(temp_path)[0] + '.json'
+        with self._lock():
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+            deduplicated = os.path.exists(blob_path)
+            if deduplicated:
+                os.remove(temp_path)
+                # Mark as recently used for LRU eviction
+                os.utime(blob_path)
+            else:
+                os.replace(temp_path, blob_path)
+            self._write_refs(sha256, self._read_refs(sha256) + 1)
+        return blob_path, deduplicated
+
+    def release(self, sha256):
+        """Drop one reference, deleting the file once nothing refers to it."""
+        with self._lock():
+            refs = max(0, self._read_refs(sha256) - 1)
+            self._write_refs(sha256, refs)
+            if refs == 0 and os.path.exists(self.blob_path(sha256)):
+                os.remove(self.blob_path(sha256))
+                logger.info(f"Removed {sha256} from upload spool")
@@ -0,0 +1,129 @@
+import functools
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.exceptions import RequestAborted
+from django.core.handlers.asgi import ASGIHandler
+from django.urls import reverse
+
+
+class ReceiveStream(io.RawIOBase):
+    """
+    A request body that is read straight from the ASGI receive channel.
+
+    Each read() pulls http.request messages from the event loop on demand,
+    so it must be called from a worker thread (e.g. inside sync_to_async).
+    The body is never buffered beyond the current message.
+    """
+
+    def __init__(self, receive):
+        super().__init__()
+        self._receive = receive
+        self._buffer = b''
+        self._more_body = True
+
+    def readable(self):
+        return True
+
+    async def _fill(self, size):
+        # Runs on the event loop; one thread hop gathers as many messages as needed
+        chunks = [self._buffer]
+        buffered = len(self._buffer)
+        while self._more_body and (size < 0 or buffered < size):
+            message = await self._receive()
+            if message["type"] == "http.disconnect":
+                raise RequestAborted()
+            body = message.get("body", b"")
+            chunks.append(body)
+            buffered += len(body)
+            self._more_body = message.get("more_body", False)
+        self._buffer = b''.join(chunks)
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+        if self._more_body and (size < 0 or len(self._buffer) < size):
+            async_to_sync(self._fill)(size)
+
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class _StreamingReceive:
+    """Marks a receive callable whose body should be streamed, not spooled."""
+
+    def __init__(self, receive):
+        self.receive = receive
+
+    async def __call__(self):
+        return await self.receive()
+
+
+class StreamingUploadASGIHandler(ASGIHandler):
+    """
+    Django's ASGI handler, except that POST /upload/ is not pre-read.
+
+    Django 4.2 reads the whole body into a SpooledTemporaryFile on the event
+    loop before the view runs. For uploads the request gets a ReceiveStream
+    instead, so upload_log's handler writes, hashes and counts lines in its
+    worker thread while the body is still arriving, and the event loop only
+    awaits receive(). Everything else, including middleware, is unchanged.
+    """
+
+    def streams_body(self, scope):
+        return scope["method"] == "POST" and scope["path"] == reverse('upload_log')
+
+    async def handle(self, scope, receive, send):
+        if self.streams_body(scope):
+            receive = _StreamingReceive(receive)
+        return await super().handle(scope, receive, send)
+
+    async def read_body(self, receive):
+        if isinstance(receive, _StreamingReceive):
+            return ReceiveStream(receive.receive)
+        return await super().read_body(receive)
+
+
+class ExecutorBusy(Exception):
+    """Raised when every worker of a BoundedExecutor is already in use."""
+
+
+class BoundedExecutor:
+    """
+    A dedicated thread pool that refuses work instead of queueing it.
+
+    Receiving a body holds a thread for the whole transfer, including time
+    spent waiting on the client. Running these on their own pool keeps slow
+    clients from starving the default executor used by every other sync
+    view, and refusing work when the pool is full means no request ever
+    waits silently behind them.
+    """
+
+    def __init__(self, max_workers, thread_name_prefix=''):
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix=thread_name_prefix)
+        self.slots = threading.BoundedSemaphore(max_workers)
+
+    async def run(self, func, *args, **kwargs):
+        """Run func in the pool, or raise ExecutorBusy if every worker is busy."""
+        if not self.slots.acquire(blocking=False):
+            raise ExecutorBusy()
+        try:
+            return await sync_to_async(func, thread_sensitive=False, executor=self.executor)(*args, **kwargs)
+        finally:
+            self.slots.release()
+
+
+@functools.lru_cache(maxsize=None)
+def _build_upload_executor(max_workers):
+    return BoundedExecutor(max_workers, thread_name_prefix='logmate-upload')
+
+
+def get_upload_executor():
+    """Return the executor for upload bodies, sized by LOGMATE_UPLOAD_WORKERS."""
+    return _build_upload_executor(getattr(settings, 'LOGMATE_UPLOAD_WORKERS', 16))
@@ -1,17 +1,36 @@
 
 
+import cProfile
 from celery import shared_task 
+from celery.exceptions import Retry
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
 import time
 import logging
 import os
 from collections import Counter
+from .parser import parse_line
+from .spool import UploadSpool
+from .profiling import StageTimer
+from .paths import get_path_normalizer, path_normalization_key
+from .preview import sample_preview
 
 logger = logging.getLogger(__name__)
 
+# Lines parsed at a time before being aggregated
+PARSE_BATCH_LINES = 10000
+
+
+def result_cache_key(content_hash):
+    """Cache key for a file's result; top paths depend on the normalizer config too."""
+    return f"logmate:result:{content_hash}:{path_normalization_key()}"
+
+
 @shared_task(bind=True, max_retries=3)
-def process_log(self, log_file_path, file_name=None, file_size=0):
+def process_log(self, log_file_path, file_name=None, file_size=0, content_hash=None, profile=False,
+                preview=True):
     """
     Processes the given log file in chunks and broadcasts detailed statistics.
 
@@ -23,17 +42,35 @@ def process_log(self, log_file_path, file_name=None, file_size=0):
       - Frequency count of HTTP methods
       - Frequency count of HTTP status codes
       - Total bytes sent
-      - Top 3 requested paths
+      - Top 3 requested paths (normalized, see logapp.paths)
       - Top IP addresses
       - Top user agents
       - Timestamp statistics
 
     Progress is broadcast in 5 chunks via Django Channels.
     In case of errors, the task will automatically retry (up to 3 times).
+
+    When content_hash is given the file lives in the upload spool: results
+    are cached by hash, so re-uploads of identical content are answered from
+    the cache without reading the file (except with profile=True, which
+    always processes the file), and the spool reference is released
+    exactly once: after the COMPLETE broadcast, or when no retry is left.
+
+    Wall-clock time, CPU time and allocations are recorded per stage and
+    returned under "timings". With profile=True a cProfile dump is also
+    written next to the log file and its path returned as "profilePath".
+
+    For files of at least LOGMATE_PREVIEW_MIN_SIZE bytes (and preview=True),
+    a PREVIEW event with sampled estimates and confidence intervals is
+    broadcast before the exact pass starts.
     """
     task_id = self.request.id
     # Initialize channel_layer right at the start
     channel_layer = get_channel_layer()
+    timer = StageTimer()
+    profiler = None
+    # Set once no later attempt will need the spooled file
+    release = False
     try:
         # Get file name if not provided
         if not file_name:
@@ -45,8 +82,72 @@ def process_log(self, log_file_path, file_name=None, file_size=0):
             
         logger.info(f"Processing log file: {file_name} (size: {file_size} bytes)")
 
+        cached_result = None
+        if content_hash and not profile:
+            # A profiled run has to do the work, so it never uses the cache
+            with timer.stage("cache"):
+                cached_result = cache.get(result_cache_key(content_hash))
+        if cached_result is not None:
+            logger.info(f"Serving {file_name} from result cache ({content_hash})")
+            with timer.stage("broadcast"):
+                async_to_sync(channel_layer.group_send)(
+                    "logstatus_group",
+                    {
+                        "type": "log_status",
+                        "event": "START",
+                        "task_id": task_id,
+                        "fileName": file_name,
+                        "fileSize": file_size,
+                        "totalLines": cached_result["lineCount"],
+                        "totalChunks": 5,
+                    }
+                )
+            cached_result = {**cached_result, "timings": timer.as_dict()}
+            with timer.stage("broadcast"):
+                async_to_sync(channel_layer.group_send)(
+                    "logstatus_group",
+                    {
+                        "type": "log_status",
+                        "event": "COMPLETE",
+                        "task_id": task_id,
+                        "fileName": file_name,
+                        "fileSize": file_size,
+                        "result": cached_result,
+                        "cached": True,
+                    }
+                )
+            release = True
+            return {**cached_result, "timings": timer.as_dict()}
+
+        if profile:
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        if preview and file_size >= settings.LOGMATE_PREVIEW_MIN_SIZE:
+            with timer.stage("preview"):
+                preview_result = sample_preview(
+                    log_file_path,
+                    file_size,
+                    blocks=settings.LOGMATE_PREVIEW_BLOCKS,
+                    block_size=settings.LOGMATE_PREVIEW_BLOCK_SIZE,
+                    normalize_path=get_path_normalizer(),
+                )
+            if preview_result:
+                with timer.stage("broadcast"):
+                    async_to_sync(channel_layer.group_send)(
+                        "logstatus_group",
+                        {
+                            "type": "log_status",
+                            "event": "PREVIEW",
+                            "task_id": task_id,
+                            "fileName": file_name,
+                            "fileSize": file_size,
+                            "preview": preview_result,
+                        }
+                    )
+
         # Read all lines from the log file
-        with open(log_file_path, 'r') as f:
+        with timer.stage("read"), open(log_file_path, 'r') as f:
             lines = f.readlines()
         total_lines = len(lines)
         
@@ -57,49 +158,10 @@ def process_log(self, log_file_path, file_name=None, file_size=0):
         status_count = {}
         total_bytes = 0
         path_count = {}
+        normalize_path = get_path_normalizer()
         ip_count = Counter()
         user_agent_count = Counter()
 
-        def parse_line(line):
-            """
-            Parse a single log line.
-
-            Expected format:
-            {ip} - - [DATE] "METHOD PATH PROTOCOL" STATUS BYTES "-" "USER_AGENT"
-
-            Returns:
-              (ip, method, path, status, bytes_sent, user_agent) or None if parsing fails.
-            """
-            try:
-                # Split first to get IP address
-                ip = line.split()[0]
-
-                # Split the line by the double-quote character.
-                parts = line.split('"')
-                if len(parts) < 3:
-                    return None
-
-                request_part = parts[1].strip()  # e.g., GET /api/v1/orders HTTP/1.1
-                status_part = parts[2].strip()   # e.g., 200 1234 - 
-                user_agent = parts[3].strip() if len(parts) > 3 else "Unknown"
-
-                request_fields = request_part.split()
-                if len(request_fields) < 2:
-                    return None
-                method = request_fields[0]
-                path = request_fields[1]
-
-                status_fields = status_part.split()
-                if len(status_fields) < 2:
-                    return None
-                status = status_fields[0]
-                bytes_sent = int(status_fields[1])
-                
-                return ip, method, path, status, bytes_sent, user_agent
-            except Exception as e:
-                logger.error(f"Failed to parse line: {line}. Error: {e}")
-                return None
-
         # Set up chunk processing simulation
         chunk_size = max(1, total_lines // 5)
         channel_layer = get_channel_layer()
@@ -107,62 +169,73 @@ def process_log(self, log_file_path, file_name=None, file_size=0):
         chunk_index = 0
         
         # Notify about starting task
-        async_to_sync(channel_layer.group_send)(
-            "logstatus_group",
-            {
-                "type": "log_status",
-                "event": "START",
-                "task_id": task_id,
-                "fileName": file_name,
-                "fileSize": file_size,
-                "totalLines": total_lines,
-                "totalChunks": 5,
-            }
-        )
-
-        while processed_count < total_lines:
-            time.sleep(1)  # Simulate processing time for this chunk
-            chunk_index += 1
-            chunk_end = min(processed_count + chunk_size, total_lines)
-            chunk_lines = lines[processed_count:chunk_end]
-
-            # Process each line in the current chunk
-            for line in chunk_lines:
-                parsed = parse_line(line)
-                if not parsed:
-                    continue
-                ip, method, path, status, bytes_sent, user_agent = parsed
-
-                # Update statistics
-                methods_count[method] = methods_count.get(method, 0) + 1
-                status_count[status] = status_count.get(status, 0) + 1
-                total_bytes += bytes_sent
-                path_count[path] = path_count.get(path, 0) + 1
-                ip_count[ip] += 1
-                user_agent_count[user_agent] += 1
-
-            processed_count = chunk_end
-
-            # Broadcast chunk progress update
+        with timer.stage("broadcast"):
             async_to_sync(channel_layer.group_send)(
                 "logstatus_group",
                 {
                     "type": "log_status",
-                    "event": "CHUNK",
+                    "event": "START",
                     "task_id": task_id,
                     "fileName": file_name,
                     "fileSize": file_size,
-                    "chunkIndex": chunk_index,
-                    "totalChunks": 5,
-                    "processedCount": processed_count,
                     "totalLines": total_lines,
+                    "totalChunks": 5,
                 }
             )
 
+        while processed_count < total_lines:
+            with timer.stage("sleep"):
+                time.sleep(1)  # Simulate processing time for this chunk
+            chunk_index += 1
+            chunk_end = min(processed_count + chunk_size, total_lines)
+
+            # Parse in bounded batches, so parse and aggregate are timed as
+            # separate stages without holding a parsed copy of the chunk
+            for batch_start in range(processed_count, chunk_end, PARSE_BATCH_LINES):
+                batch = lines[batch_start:min(batch_start + PARSE_BATCH_LINES, chunk_end)]
+                with timer.stage("parse"):
+                    parsed_lines = [parse_line(line) for line in batch]
+
+                with timer.stage("aggregate"):
+                    for parsed in parsed_lines:
+                        if not parsed:
+                            continue
+                        ip, method, path, status, bytes_sent, user_agent = parsed
+
+                        # Update statistics
+                        methods_count[method] = methods_count.get(method, 0) + 1
+                        status_count[status] = status_count.get(status, 0) + 1
+                        total_bytes += bytes_sent
+                        path = normalize_path(path)
+                        path_count[path] = path_count.get(path, 0) + 1
+                        ip_count[ip] += 1
+                        user_agent_count[user_agent] += 1
+                del parsed_lines
+
+            processed_count = chunk_end
+
+            # Broadcast chunk progress update
+            with timer.stage("broadcast"):
+                async_to_sync(channel_layer.group_send)(
+                    "logstatus_group",
+                    {
+                        "type": "log_status",
+                        "event": "CHUNK",
+                        "task_id": task_id,
+                        "fileName": file_name,
+                        "fileSize": file_size,
+                        "chunkIndex": chunk_index,
+                        "totalChunks": 5,
+                        "processedCount": processed_count,
+                        "totalLines": total_lines,
+                    }
+                )
+
         # Determine top entries
-        top_paths = sorted(path_count.items(), key=lambda x: x[1], reverse=True)[:3]
-        top_ips = sorted(ip_count.items(), key=lambda x: x[1], reverse=True)[:5]
-        top_agents = sorted(user_agent_count.items(), key=lambda x: x[1], reverse=True)[:3]
+        with timer.stage("topN"):
+            top_paths = sorted(path_count.items(), key=lambda x: x[1], reverse=True)[:3]
+            top_ips = sorted(ip_count.items(), key=lambda x: x[1], reverse=True)[:5]
+            top_agents = sorted(user_agent_count.items(), key=lambda x: x[1], reverse=True)[:3]
 
         final_result = {
             "lineCount": total_lines,
@@ -174,30 +247,67 @@ def process_log(self, log_file_path, file_name=None, file_size=0):
             "topUserAgents": top_agents
         }
 
+        if profiler:
+            profiler.disable()
+            profile_path = f"{os.path.splitext(log_file_path)[0]}.{task_id}.prof"
+            profiler.dump_stats(profile_path)
+            profiler = None
+            logger.info(f"Profile for task {task_id} written to {profile_path}")
+
+        if content_hash:
+            # Timings describe this run only, so they are not cached
+            with timer.stage("cache"):
+                cache.set(result_cache_key(content_hash), final_result, settings.LOGMATE_RESULT_CACHE_TIMEOUT)
+
+        final_result = {**final_result, "timings": timer.as_dict()}
+        if profile:
+            final_result["profilePath"] = profile_path
+
         # Broadcast final complete event with detailed statistics
-        async_to_sync(channel_layer.group_send)(
-            "logstatus_group",
-            {
-                "type": "log_status",
-                "event": "COMPLETE",
-                "task_id": task_id,
-                "fileName": file_name,
-                "fileSize": file_size,
-                "result": final_result,
-            }
-        )
-        return final_result
+        with timer.stage("broadcast"):
+            async_to_sync(channel_layer.group_send)(
+                "logstatus_group",
+                {
+                    "type": "log_status",
+                    "event": "COMPLETE",
+                    "task_id": task_id,
+                    "fileName": file_name,
+                    "fileSize": file_size,
+                    "result": final_result,
+                }
+            )
+        release = True
+        # The task result also accounts for the COMPLETE broadcast
+        return {**final_result, "timings": timer.as_dict()}
 
     except Exception as e:
+        if profiler:
+            profiler.disable()
         logger.error(f"Error processing log file: {e}", exc_info=True)
-        async_to_sync(channel_layer.group_send)(
-            "logstatus_group",
-            {
-                "type": "log_status",
-                "event": "ERROR",
-                "task_id": task_id,
-                "fileName": file_name if file_name else os.path.basename(log_file_path),
-                "message": str(e)
-            }
-        )
-        raise self.retry(exc=e)
+        try:
+            async_to_sync(channel_layer.group_send)(
+                "logstatus_group",
+                {
+                    "type": "log_status",
+                    "event": "ERROR",
+                    "task_id": task_id,
+                    "fileName": file_name if file_name else os.path.basename(log_file_path),
+                    "message": str(e)
+                }
+            )
+        except Exception as send_error:
+            # Likely the same outage that failed the task; the retry must still happen
+            logger.error(f"Failed to broadcast error for task {task_id}: {send_error}", exc_info=True)
+        try:
+            raise self.retry(exc=e)
+        except Retry:
+            raise
+        except BaseException:
+            # Out of retries, or the retry could not be scheduled: no later
+            # attempt will need the file
+            release = True
+            raise
+
+    finally:
+        if content_hash and release:
+            UploadSpool().release(content_hash)
@@ -1,15 +1,44 @@
-from django.test import TestCase, Client
+from django.test import TestCase, SimpleTestCase, Client, RequestFactory, override_settings
 from django.urls import reverse
+from django.core.management import call_command, CommandError
 from django.core.files.uploadedfile import SimpleUploadedFile
+import asyncio
+import hashlib
+import json
+import pstats
+from io import StringIO
+import shutil
+import socket
 import tempfile
 import os
 from unittest.mock import patch
+from celery.exceptions import Retry
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from asgiref.testing import ApplicationCommunicator
+from logapp.streaming import StreamingUploadASGIHandler, get_upload_executor
+from django.core.cache import cache
+from logapp.live import SlidingWindowStats
+from logapp.paths import PathNormalizer, get_path_normalizer
+from logapp.preview import sample_preview
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+from logapp.spool import UploadSpool, SpoolFull
+from logapp.tasks import process_log, result_cache_key
+from logapp.views import chunked_upload_append, upload_log
+from logapp.routing import websocket_urlpatterns
+from logapp.consumers import LogIngestConsumer
+
+LOG_LINE = '10.0.0.1 - - [10/Oct/2024:13:55:36 +0000] "GET {path} HTTP/1.1" {status} 512 "-" "curl/7.68.0"'
 
 class LogAppViewsTest(TestCase):
     def setUp(self):
         self.client = Client()
         self.upload_url = reverse('upload_log')
         self.csrf_url = reverse('get_csrf_token')
+        self.spool_dir = tempfile.mkdtemp()
+        self.spool_settings = override_settings(LOGMATE_SPOOL_DIR=self.spool_dir)
+        self.spool_settings.enable()
 
     def test_get_csrf_token(self):
         response = self.client.get(self.csrf_url)
@@ -51,6 +80,53 @@ class LogAppViewsTest(TestCase):
         self.assertEqual(response_data['file_name'], 'test.log')
         self.assertEqual(response_data['file_size'], len(test_content))
 
+    @patch('logapp.views.process_log.delay')
+    def test_upload_log_streams_stats(self, mock_process_log):
+        mock_process_log.return_value.id = 'test_task_id'
+        test_content = b'line one\nline two\nline three'
+        test_file = SimpleUploadedFile(name='stream.log', content=test_content)
+
+        response = self.client.post(self.upload_url, {'log_file': test_file})
+
+        self.assertEqual(response.status_code, 200)
+        response_data = response.json()
+        self.assertEqual(response_data['line_count'], 3)
+        self.assertEqual(response_data['sha256'], hashlib.sha256(test_content).hexdigest())
+
+        # The task receives the path the handler streamed the body into
+        file_path, file_name = mock_process_log.call_args[0][:2]
+        self.assertEqual(file_name, 'stream.log')
+        with open(file_path, 'rb') as f:
+            self.assertEqual(f.read(), test_content)
+
+    @patch('logapp.views.process_log.delay')
+    def test_upload_log_skips_other_file_fields(self, mock_process_log):
+        mock_process_log.return_value.id = 'test_task_id'
+
+        response = self.client.post(self.upload_url, {
+            'log_file': SimpleUploadedFile(name='access.log', content=b'line\n'),
+            'extra': SimpleUploadedFile(name='extra.bin', content=b'not a log'),
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(os.listdir(os.path.join(self.spool_dir, 'incoming')), [])
+
+    def test_upload_log_rejects_malformed_content_length(self):
+        # Built directly, as the test client's middleware would reject it first
+        request = RequestFactory().post(
+            self.upload_url, data=b'', content_type='multipart/form-data; boundary=x', CONTENT_LENGTH='big',
+        )
+        response = async_to_sync(upload_log)(request)
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_upload_log_enforces_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        test_file = SimpleUploadedFile(name='test.log', content=b'Test content')
+
+        response = client.post(self.upload_url, {'log_file': test_file})
+
+        self.assertEqual(response.status_code, 403)
 
     def test_upload_log_os_error(self):
         # Simulate an OS error by mocking 'os.makedirs'
@@ -66,7 +142,32 @@ class LogAppViewsTest(TestCase):
         self.assertIn('error', response.json())
         self.assertTrue('Mocked OS error' in response.json()['error'])
 
+    @patch('logapp.views.process_log.delay')
+    def test_upload_log_deduplicates_identical_content(self, mock_process_log):
+        mock_process_log.return_value.id = 'test_task_id'
+        for name in ('access.log', 'copy-of-access.log'):
+            response = self.client.post(
+                self.upload_url, {'log_file': SimpleUploadedFile(name=name, content=b'same\n')}
+            )
+
+        self.assertTrue(response.json()['deduplicated'])
+        first_path = mock_process_log.call_args_list[0][0][0]
+        second_path = mock_process_log.call_args_list[1][0][0]
+        self.assertEqual(first_path, second_path)
+        self.assertEqual(mock_process_log.call_args_list[1][0][3], hashlib.sha256(b'same\n').hexdigest())
+
+    def test_upload_log_spool_full(self):
+        test_file = SimpleUploadedFile(name='test.log', content=b'Test content')
+
+        with override_settings(LOGMATE_SPOOL_QUOTA_BYTES=10):
+            response = self.client.post(self.upload_url, {'log_file': test_file})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
     def tearDown(self):
+        self.spool_settings.disable()
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
         # Clean up any temporary files
         temp_dir = tempfile.gettempdir()
         for file in os.listdir(temp_dir):
@@ -74,4 +175,709 @@ class LogAppViewsTest(TestCase):
                 try:
                     os.remove(os.path.join(temp_dir, file))
                 except:
-                    pass
\ No newline at end of file
+                    pass
+
+class ChunkedUploadViewsTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.init_url = reverse('chunked_upload_init')
+        self.spool_dir = tempfile.mkdtemp()
+        self.spool_settings = override_settings(LOGMATE_SPOOL_DIR=self.spool_dir)
+        self.spool_settings.enable()
+
+    def start_upload(self, content, file_name='chunked.log'):
+        response = self.client.post(self.init_url, {'file_name': file_name, 'file_size': len(content)})
+        self.assertEqual(response.status_code, 201)
+        return response.json()['upload_id']
+
+    def append(self, upload_id, offset, data):
+        return self.client.post(
+            reverse('chunked_upload_append', args=[upload_id]),
+            data=data,
+            content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    @patch('logapp.views.process_log.delay')
+    def test_chunked_upload_resume_and_finalize(self, mock_process_log):
+        mock_process_log.return_value.id = 'test_task_id'
+        content = b'first line\nsecond line\nthird line\n'
+        upload_id = self.start_upload(content)
+
+        response = self.append(upload_id, 0, content[:15])
+        self.assertEqual(response.json()['offset'], 15)
+
+        # A client that lost the response asks where to resume
+        response = self.client.get(reverse('chunked_upload_status', args=[upload_id]))
+        self.assertEqual(response.json()['offset'], 15)
+
+        response = self.append(upload_id, 15, content[15:])
+        self.assertEqual(response.json()['offset'], len(content))
+
+        response = self.client.post(reverse('chunked_upload_finalize', args=[upload_id]))
+        self.assertEqual(response.status_code, 200)
+        response_data = response.json()
+        self.assertEqual(response_data['task_id'], 'test_task_id')
+        self.assertEqual(response_data['line_count'], 3)
+        self.assertEqual(response_data['sha256'], hashlib.sha256(content).hexdigest())
+
+        file_path = mock_process_log.call_args[0][0]
+        with open(file_path, 'rb') as f:
+            self.assertEqual(f.read(), content)
+
+    @patch('logapp.views.process_log.delay')
+    def test_chunked_upload_finalize_is_idempotent(self, mock_process_log):
+        mock_process_log.return_value.id = 'test_task_id'
+        content = b'only line\n'
+        upload_id = self.start_upload(content)
+        self.append(upload_id, 0, content)
+        finalize_url = reverse('chunked_upload_finalize', args=[upload_id])
+
+        first = self.client.post(finalize_url)
+        # The client lost the first response and retries
+        second = self.client.post(finalize_url)
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        mock_process_log.assert_called_once()
+        status = self.client.get(reverse('chunked_upload_status', args=[upload_id])).json()
+        self.assertTrue(status['completed'])
+
+        response = self.append(upload_id, len(content), b'more\n')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(os.path.exists(os.path.join(self.spool_dir, 'chunked', f'{upload_id}.part')))
+
+    @patch('logapp.views.process_log.delay')
+    def test_chunked_upload_finalize_survives_dispatch_failure(self, mock_process_log):
+        content = b'only line\n'
+        upload_id = self.start_upload(content)
+        self.append(upload_id, 0, content)
+        finalize_url = reverse('chunked_upload_finalize', args=[upload_id])
+        mock_process_log.side_effect = ConnectionError('broker unavailable')
+
+        response = self.client.post(finalize_url)
+
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('error', response.json())
+        # The spooled copy was released and the upload itself is untouched
+        self.assertEqual(UploadSpool().usage(), len(content))
+        mock_process_log.side_effect = None
+        mock_process_log.return_value.id = 'test_task_id'
+        response = self.client.post(finalize_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['task_id'], 'test_task_id')
+        with open(mock_process_log.call_args[0][0], 'rb') as f:
+            self.assertEqual(f.read(), content)
+
+    def test_chunked_upload_rejects_malformed_content_length(self):
+        upload_id = self.start_upload(b'0123')
+
+        # Built directly, as the test client's middleware would reject it first
+        request = RequestFactory().post(
+            reverse('chunked_upload_append', args=[upload_id]),
+            data=b'0123',
+            content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET='0',
+            CONTENT_LENGTH='four',
+        )
+        response = async_to_sync(chunked_upload_append)(request, upload_id)
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_chunked_upload_declared_size_counts_towards_quota(self):
+        with override_settings(LOGMATE_SPOOL_QUOTA_BYTES=100):
+            self.start_upload(b'x' * 60)
+            # Nothing has been appended yet, but the first upload's 60 bytes are spoken for
+            response = self.client.post(self.init_url, {'file_name': 'second.log', 'file_size': 60})
+
+        self.assertEqual(response.status_code, 429)
+
+    def test_chunked_upload_offset_mismatch(self):
+        upload_id = self.start_upload(b'0123456789')
+        self.append(upload_id, 0, b'01234')
+
+        response = self.append(upload_id, 2, b'23456')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 5)
+
+    def test_chunked_upload_rejects_oversized_chunk(self):
+        upload_id = self.start_upload(b'0123')
+
+        response = self.append(upload_id, 0, b'0123456789')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['offset'], 0)
+
+    def test_chunked_upload_finalize_incomplete(self):
+        upload_id = self.start_upload(b'0123456789')
+        self.append(upload_id, 0, b'01234')
+
+        response = self.client.post(reverse('chunked_upload_finalize', args=[upload_id]))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 5)
+
+    def test_chunked_upload_unknown_id(self):
+        response = self.client.get(reverse('chunked_upload_status', args=['not-an-upload']))
+        self.assertEqual(response.status_code, 404)
+
+    def tearDown(self):
+        self.spool_settings.disable()
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+
+class UploadExecutorTest(TestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.spool_settings = override_settings(LOGMATE_SPOOL_DIR=self.spool_dir, LOGMATE_UPLOAD_WORKERS=1)
+        self.spool_settings.enable()
+
+    def test_busy_upload_workers_reject_instead_of_queueing(self):
+        upload_id = Client().post(
+            reverse('chunked_upload_init'), {'file_name': 'a.log', 'file_size': 4}
+        ).json()['upload_id']
+        executor = get_upload_executor()
+        # A slow client is holding the only upload worker
+        executor.slots.acquire()
+        try:
+            response = self.client.post(
+                reverse('upload_log'), {'log_file': SimpleUploadedFile(name='a.log', content=b'line\n')}
+            )
+            status = self.client.get(reverse('chunked_upload_status', args=[upload_id]))
+        finally:
+            executor.slots.release()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        # Requests that do not receive a body are unaffected
+        self.assertEqual(status.status_code, 200)
+
+    def tearDown(self):
+        self.spool_settings.disable()
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+
+class UploadSpoolTest(SimpleTestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.spool = UploadSpool(self.spool_dir, quota=100)
+
+    def spool_file(self, content):
+        temp_path = self.spool.incoming_path()
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+        return self.spool.store(temp_path, hashlib.sha256(content).hexdigest())
+
+    def test_file_is_removed_after_last_release(self):
+        sha256 = hashlib.sha256(b'x' * 10).hexdigest()
+        path, _ = self.spool_file(b'x' * 10)
+        self.spool_file(b'x' * 10)
+
+        self.spool.release(sha256)
+        self.assertTrue(os.path.exists(path))
+        self.spool.release(sha256)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.spool.usage(), 0)
+
+    def test_reserve_evicts_least_recently_used(self):
+        old_path, _ = self.spool_file(b'a' * 40)
+        new_path, _ = self.spool_file(b'b' * 40)
+        for path in (old_path, new_path):
+            # Still referenced on disk, but by tasks that were killed long ago
+            os.utime(path[:-len('.log')] + '.refs', (1000, 1000))
+        os.utime(old_path, (1000, 1000))
+
+        self.spool.reserve(50)
+
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(new_path))
+
+    def test_reserve_evicts_orphaned_references(self):
+        orphaned_path, _ = self.spool_file(b'a' * 40)
+        live_path, _ = self.spool_file(b'b' * 40)
+        # The task holding this reference was killed a long time ago
+        os.utime(orphaned_path[:-len('.log')] + '.refs', (1000, 1000))
+
+        self.spool.reserve(50)
+
+        self.assertFalse(os.path.exists(orphaned_path))
+        self.assertFalse(os.path.exists(orphaned_path[:-len('.log')] + '.refs'))
+        self.assertTrue(os.path.exists(live_path))
+
+    def test_reservations_count_until_written(self):
+        upload_id = self.spool.reserve(60)
+        with open(os.path.join(self.spool.incoming_dir, f'{upload_id}.part'), 'wb') as f:
+            f.write(b'x' * 20)
+
+        # 20 bytes on disk plus 40 still to come
+        self.assertEqual(self.spool.usage(), 60)
+        with self.assertRaises(SpoolFull):
+            self.spool.reserve(50)
+
+        self.spool.discard(upload_id)
+        self.assertEqual(self.spool.usage(), 0)
+        self.spool.reserve(50)
+
+    def test_reserve_evicts_abandoned_reservations(self):
+        upload_id = self.spool.reserve(80)
+        meta_path = os.path.join(self.spool.incoming_dir, f'{upload_id}.json')
+        os.utime(meta_path, (1000, 1000))
+
+        self.spool.reserve(50)
+
+        self.assertFalse(os.path.exists(meta_path))
+
+    def test_reserve_never_evicts_referenced_files(self):
+        path, _ = self.spool_file(b'a' * 80)
+
+        with self.assertRaises(SpoolFull):
+            self.spool.reserve(50)
+        self.assertTrue(os.path.exists(path))
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class ProcessLogCacheTest(SimpleTestCase):
+    def test_cached_result_skips_processing(self):
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir, ignore_errors=True)
+        spool = UploadSpool(spool_dir)
+        temp_path = spool.incoming_path()
+        with open(temp_path, 'wb') as f:
+            f.write(b'cached\n')
+        sha256 = hashlib.sha256(b'cached\n').hexdigest()
+        path, _ = spool.store(temp_path, sha256)
+        cached = {'lineCount': 1, 'topPaths': []}
+        cache.set(result_cache_key(sha256), cached)
+
+        with override_settings(LOGMATE_SPOOL_DIR=spool_dir), patch('logapp.tasks.open') as mock_open:
+            result = process_log.apply(args=[path, 'cached.log', 7, sha256]).get()
+
+        self.assertEqual({k: v for k, v in result.items() if k != 'timings'}, cached)
+        self.assertIn('cache', result['timings'])
+        self.assertEqual(result['timings']['broadcast']['calls'], 2)
+        mock_open.assert_not_called()
+        self.assertFalse(os.path.exists(path))
+
+    def test_cache_key_follows_path_normalization(self):
+        key = result_cache_key('abc')
+
+        with override_settings(LOGMATE_PATH_TEMPLATES=['/api/v1/users/{id}']):
+            self.assertNotEqual(result_cache_key('abc'), key)
+        with override_settings(LOGMATE_PATH_NORMALIZATION=False):
+            self.assertNotEqual(result_cache_key('abc'), key)
+        self.assertEqual(result_cache_key('abc'), key)
+
+    def test_profiled_run_skips_cache(self):
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir, ignore_errors=True)
+        spool = UploadSpool(spool_dir)
+        content = (LOG_LINE.format(path='/api/v1/orders', status=200) + '\n').encode()
+        temp_path = spool.incoming_path()
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+        sha256 = hashlib.sha256(content).hexdigest()
+        path, _ = spool.store(temp_path, sha256)
+        cache.set(result_cache_key(sha256), {'lineCount': 1, 'topPaths': []})
+
+        with override_settings(LOGMATE_SPOOL_DIR=spool_dir), patch('logapp.tasks.time.sleep'):
+            result = process_log.apply(args=[path, 'cached.log', len(content), sha256],
+                                       kwargs={'profile': True}).get()
+
+        self.assertTrue(os.path.exists(result['profilePath']))
+        self.assertEqual(result['topPaths'], [('/api/v1/orders', 1)])
+
+    @patch('logapp.tasks.process_log.retry')
+    def test_reference_is_released_once_across_retries(self, mock_retry):
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir, ignore_errors=True)
+        spool = UploadSpool(spool_dir)
+        sha256 = hashlib.sha256(b'cached\n').hexdigest()
+        for _ in range(2):
+            # A second upload of the same content holds another reference
+            temp_path = spool.incoming_path()
+            with open(temp_path, 'wb') as f:
+                f.write(b'cached\n')
+            path, _ = spool.store(temp_path, sha256)
+        cache.set(result_cache_key(sha256), {'lineCount': 1, 'topPaths': []})
+        mock_retry.side_effect = Retry()
+        channel_layer = get_channel_layer()
+        sent = []
+
+        async def failing_complete(group, message):
+            sent.append(message['event'])
+            if message['event'] == 'COMPLETE' and sent.count('COMPLETE') == 1:
+                raise RuntimeError('channel layer unavailable')
+
+        with override_settings(LOGMATE_SPOOL_DIR=spool_dir), \
+                patch.object(channel_layer, 'group_send', failing_complete):
+            # The COMPLETE broadcast fails, so the task is retried
+            with self.assertRaises(Retry):
+                process_log.apply(args=[path, 'cached.log', 7, sha256], throw=True)
+            self.assertTrue(os.path.exists(path))
+            process_log.apply(args=[path, 'cached.log', 7, sha256]).get()
+
+        # Only the retried task's reference is gone
+        self.assertEqual(open(path[:-len('.log')] + '.refs').read(), '1')
+
+    def test_reference_is_released_when_channel_layer_is_down(self):
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir, ignore_errors=True)
+        spool = UploadSpool(spool_dir)
+        sha256 = hashlib.sha256(b'cached\n').hexdigest()
+        temp_path = spool.incoming_path()
+        with open(temp_path, 'wb') as f:
+            f.write(b'cached\n')
+        path, _ = spool.store(temp_path, sha256)
+        cache.set(result_cache_key(sha256), {'lineCount': 1, 'topPaths': []})
+        channel_layer = get_channel_layer()
+
+        async def unavailable(group, message):
+            raise RuntimeError('channel layer unavailable')
+
+        # Every attempt fails, ERROR broadcasts included, until retries run out
+        with override_settings(LOGMATE_SPOOL_DIR=spool_dir), \
+                patch.object(channel_layer, 'group_send', unavailable):
+            result = process_log.apply(args=[path, 'cached.log', 7, sha256])
+
+        self.assertTrue(result.failed())
+        self.assertFalse(os.path.exists(path))
+
+
+class SlidingWindowStatsTest(SimpleTestCase):
+    def test_windows_expire_independently(self):
+        stats = SlidingWindowStats()
+        stats.add(LOG_LINE.format(path='/old', status=500), now=1000)
+        for _ in range(3):
+            stats.add(LOG_LINE.format(path='/new', status=200), now=1100)
+
+        windows = stats.snapshot(now=1100)['windows']
+
+        # The /old line is more than a minute old but still inside 5m and 15m
+        self.assertEqual(windows['1m']['requests'], 3)
+        self.assertEqual(windows['1m']['statusCount'], {'200': 3})
+        self.assertEqual(windows['1m']['topPaths'], [('/new', 3)])
+        self.assertEqual(windows['5m']['requests'], 4)
+        self.assertEqual(windows['5m']['statusCount'], {'500': 1, '200': 3})
+        self.assertEqual(windows['15m']['topPaths'], [('/new', 3), ('/old', 1)])
+
+    def test_request_rate_uses_elapsed_time(self):
+        stats = SlidingWindowStats()
+        for second in range(1000, 1010):
+            stats.add(LOG_LINE.format(path='/', status=200), now=second)
+
+        windows = stats.snapshot(now=1009)['windows']
+
+        self.assertEqual(windows['1m']['requestRate'], 1.0)
+
+    def test_everything_expires_after_largest_window(self):
+        stats = SlidingWindowStats()
+        stats.add(LOG_LINE.format(path='/', status=200), now=1000)
+
+        windows = stats.snapshot(now=1000 + 900)['windows']
+
+        for window in windows.values():
+            self.assertEqual(window['requests'], 0)
+            self.assertEqual(window['statusCount'], {})
+
+    def test_paths_are_normalized(self):
+        stats = SlidingWindowStats()
+        stats.add(LOG_LINE.format(path='/api/v1/users/8812', status=200), now=1000)
+        stats.add(LOG_LINE.format(path='/api/v1/users/9917?tab=1', status=200), now=1000)
+
+        windows = stats.snapshot(now=1000)['windows']
+
+        self.assertEqual(windows['1m']['topPaths'], [('/api/v1/users/{id}', 2)])
+
+    def test_unparseable_lines_are_skipped(self):
+        stats = SlidingWindowStats()
+        self.assertFalse(stats.add('garbage', now=1000))
+        self.assertEqual(stats.snapshot(now=1000)['windows']['1m']['requests'], 0)
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    LOGMATE_LIVE_PUBLISH_INTERVAL=0.05,
+)
+class LogIngestConsumerTest(SimpleTestCase):
+    async def test_ingested_lines_are_published(self):
+        application = URLRouter(websocket_urlpatterns)
+        dashboard = WebsocketCommunicator(application, '/ws/livestats/')
+        shipper = WebsocketCommunicator(application, '/ws/ingest/')
+
+        with patch('logapp.consumers.live_stats', SlidingWindowStats()):
+            self.assertTrue((await dashboard.connect())[0])
+            self.assertTrue((await shipper.connect())[0])
+            await shipper.send_to(text_data='\n'.join(
+                LOG_LINE.format(path='/api/v1/orders', status=200) for _ in range(5)
+            ))
+
+            message = await dashboard.receive_json_from(timeout=2)
+            while message['windows']['1m']['requests'] == 0:
+                message = await dashboard.receive_json_from(timeout=2)
+
+            await shipper.disconnect()
+            await dashboard.disconnect()
+
+        self.assertEqual(message['event'], 'LIVE')
+        self.assertEqual(message['instance'], f'{socket.gethostname()}:{os.getpid()}')
+        self.assertEqual(message['windows']['1m']['requests'], 5)
+        self.assertEqual(message['windows']['1m']['topPaths'], [['/api/v1/orders', 5]])
+
+    async def test_publisher_survives_send_failures(self):
+        channel_layer = get_channel_layer()
+        calls = []
+
+        async def flaky_group_send(group, message):
+            calls.append(group)
+            if len(calls) == 1:
+                raise RuntimeError('channel layer unavailable')
+
+        with patch.object(channel_layer, 'group_send', flaky_group_send), \
+                patch('logapp.consumers.get_channel_layer', return_value=channel_layer), \
+                override_settings(LOGMATE_LIVE_PUBLISH_INTERVAL=0.01):
+            publisher = asyncio.create_task(LogIngestConsumer.publish_stats())
+            for _ in range(100):
+                if len(calls) >= 2:
+                    break
+                await asyncio.sleep(0.01)
+            publisher.cancel()
+
+        self.assertEqual(calls[:2], ['livestats_group', 'livestats_group'])
+
+
+class LoadTestCommandTest(SimpleTestCase):
+    def test_loadtest_reports_deliveries(self):
+        out = StringIO()
+        call_command('loadtest_ws', clients=3, rate=500, events=14, drain=2, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('clients connected:  3', output)
+        self.assertIn('deliveries:         42 / 42', output)
+        self.assertIn('dropped:            0', output)
+
+    def test_loadtest_rejects_non_positive_options(self):
+        for options in ({'rate': 0}, {'clients': -1}, {'events': 0}):
+            with self.subTest(**options), self.assertRaises(CommandError):
+                call_command('loadtest_ws', stdout=StringIO(), **options)
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class ProcessLogTimingTest(SimpleTestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.spool_dir, 'access.log')
+        with open(self.log_path, 'w') as f:
+            for status in (200, 200, 404):
+                f.write(LOG_LINE.format(path='/api/v1/orders', status=status) + '\n')
+
+    @patch('logapp.tasks.time.sleep')
+    def test_result_includes_stage_timings(self, mock_sleep):
+        result = process_log.apply(args=[self.log_path, 'access.log']).get()
+
+        self.assertEqual(result['lineCount'], 3)
+        for stage in ('read', 'parse', 'aggregate', 'topN', 'broadcast', 'sleep'):
+            self.assertIn(stage, result['timings'])
+            self.assertEqual(
+                set(result['timings'][stage]), {'wallMs', 'cpuMs', 'allocatedBlocks', 'calls'}
+            )
+        # START, three CHUNKs and COMPLETE
+        self.assertEqual(result['timings']['broadcast']['calls'], 5)
+        # One parse batch per chunk
+        self.assertEqual(result['timings']['parse']['calls'], 3)
+        self.assertNotIn('profilePath', result)
+
+    @patch('logapp.tasks.time.sleep')
+    def test_profile_is_written_next_to_the_log(self, mock_sleep):
+        result = process_log.apply(args=[self.log_path, 'access.log'], kwargs={'profile': True}).get()
+
+        profile_path = result['profilePath']
+        self.assertEqual(os.path.dirname(profile_path), self.spool_dir)
+        self.assertTrue(profile_path.endswith('.prof'))
+        self.assertGreater(pstats.Stats(profile_path).total_calls, 0)
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+
+class PathNormalizerTest(SimpleTestCase):
+    def test_generic_placeholders(self):
+        normalize = PathNormalizer().normalize
+
+        self.assertEqual(normalize('/api/v1/users/8812'), '/api/v1/users/{id}')
+        self.assertEqual(normalize('/api/v1/users/8812/'), '/api/v1/users/{id}/')
+        self.assertEqual(
+            normalize('/orders/123e4567-e89b-12d3-a456-426614174000/items'), '/orders/{uuid}/items'
+        )
+        self.assertEqual(normalize('/static/app.3f2a9c1b7d4e6f80.js'), '/static/app.3f2a9c1b7d4e6f80.js')
+        self.assertEqual(normalize('/blobs/d41d8cd98f00b204e9800998ecf8427e'), '/blobs/{hash}')
+        self.assertEqual(normalize('/search?q=logs#top'), '/search')
+        self.assertEqual(normalize('/'), '/')
+
+    def test_templates_take_precedence(self):
+        normalize = PathNormalizer(['/api/v1/users/{user}/avatar', '/files/{name}']).normalize
+
+        self.assertEqual(normalize('/api/v1/users/jdoe/avatar'), '/api/v1/users/{user}/avatar')
+        self.assertEqual(normalize('/files/report.pdf?download=1'), '/files/{name}')
+        self.assertEqual(normalize('/files/a/b'), '/files/a/b')
+
+    def test_repeated_paths_hit_the_memo_cache(self):
+        normalizer = PathNormalizer(cache_size=2)
+        for _ in range(3):
+            normalizer.normalize('/api/v1/users/8812')
+        normalizer.normalize('/a')
+        normalizer.normalize('/b')
+
+        info = normalizer.normalize.cache_info()
+        self.assertEqual(info.hits, 2)
+        self.assertEqual(info.currsize, 2)
+
+    def test_normalization_can_be_disabled(self):
+        with override_settings(LOGMATE_PATH_NORMALIZATION=False):
+            self.assertEqual(get_path_normalizer()('/api/v1/users/8812?x=1'), '/api/v1/users/8812?x=1')
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class PreviewTest(SimpleTestCase):
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.log_dir, 'big.log')
+        self.line_count = 20000
+        with open(self.log_path, 'w') as f:
+            for i in range(self.line_count):
+                status = 404 if i % 4 == 0 else 200
+                f.write(LOG_LINE.format(path=f'/api/v1/users/{i}', status=status) + '\n')
+        self.file_size = os.path.getsize(self.log_path)
+
+    def test_estimates_bracket_the_exact_counts(self):
+        preview = sample_preview(
+            self.log_path, self.file_size, blocks=16, block_size=4096,
+            normalize_path=PathNormalizer().normalize, seed=7,
+        )
+
+        self.assertLess(preview['sampledBytes'], self.file_size / 10)
+        line_count = preview['lineCount']
+        self.assertLessEqual(line_count['low'], self.line_count)
+        self.assertGreaterEqual(line_count['high'], self.line_count)
+        not_found = preview['statusCount']['404']
+        self.assertLessEqual(not_found['low'], self.line_count // 4)
+        self.assertGreaterEqual(not_found['high'], self.line_count // 4)
+        self.assertEqual(preview['topPaths'][0][0], '/api/v1/users/{id}')
+
+    def test_small_file_is_counted_exactly(self):
+        # 16 blocks of 256 KB would overlap many times over in this file
+        preview = sample_preview(self.log_path, self.file_size, blocks=16, block_size=256 * 1024, seed=7)
+
+        self.assertEqual(preview['blocks'], 1)
+        self.assertEqual(preview['sampledBytes'], self.file_size)
+        self.assertEqual(
+            preview['lineCount'],
+            {'estimate': self.line_count, 'low': self.line_count, 'high': self.line_count},
+        )
+        self.assertEqual(preview['statusCount']['404']['high'], self.line_count // 4)
+
+    @override_settings(LOGMATE_PREVIEW_MIN_SIZE=1, LOGMATE_PREVIEW_BLOCKS=8, LOGMATE_PREVIEW_BLOCK_SIZE=4096)
+    @patch('logapp.tasks.time.sleep')
+    def test_preview_event_precedes_exact_result(self, mock_sleep):
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)('logstatus_group', channel)
+
+        process_log.apply(args=[self.log_path, 'big.log', self.file_size]).get()
+
+        async def drain():
+            events = []
+            while not events or events[-1] != 'COMPLETE':
+                events.append((await channel_layer.receive(channel))['event'])
+            return events
+        events = async_to_sync(drain)()
+        self.assertEqual(events[0], 'PREVIEW')
+        self.assertEqual(events[1], 'START')
+        self.assertEqual(events[-1], 'COMPLETE')
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir, ignore_errors=True)
+
+
+class StreamingUploadASGITest(SimpleTestCase):
+    boundary = 'LogMateBoundary'
+    csrf_token = 'a' * 32
+
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.spool_settings = override_settings(LOGMATE_SPOOL_DIR=self.spool_dir)
+        self.spool_settings.enable()
+
+    def multipart(self, content):
+        return (
+            f'--{self.boundary}\r\n'
+            'Content-Disposition: form-data; name="log_file"; filename="stream.log"\r\n'
+            'Content-Type: text/plain\r\n\r\n'
+        ).encode() + content + f'\r\n--{self.boundary}--\r\n'.encode()
+
+    def communicator(self, body):
+        scope = {
+            'type': 'http',
+            'method': 'POST',
+            'path': '/upload/',
+            'query_string': b'',
+            'headers': [
+                (b'host', b'localhost'),
+                (b'content-type', f'multipart/form-data; boundary={self.boundary}'.encode()),
+                (b'content-length', str(len(body)).encode()),
+                (b'cookie', f'csrftoken={self.csrf_token}'.encode()),
+                (b'x-csrftoken', self.csrf_token.encode()),
+            ],
+        }
+        return ApplicationCommunicator(StreamingUploadASGIHandler(), scope)
+
+    @patch('logapp.views.process_log.delay')
+    @patch('django.core.handlers.asgi.tempfile.SpooledTemporaryFile', side_effect=AssertionError('body was pre-read'))
+    async def test_upload_body_is_streamed(self, mock_spooled_file, mock_process_log):
+        mock_process_log.return_value.id = 'test_task_id'
+        content = b'line one\nline two\n' * 1000
+        body = self.multipart(content)
+        communicator = self.communicator(body)
+
+        for start in range(0, len(body), 4096):
+            await communicator.send_input({
+                'type': 'http.request',
+                'body': body[start:start + 4096],
+                'more_body': start + 4096 < len(body),
+            })
+        response_start = await communicator.receive_output(timeout=5)
+        response_body = await communicator.receive_output(timeout=5)
+
+        self.assertEqual(response_start['status'], 200)
+        self.assertEqual(json.loads(response_body['body'])['line_count'], 2000)
+        with open(mock_process_log.call_args[0][0], 'rb') as f:
+            self.assertEqual(f.read(), content)
+        # The reservation ended when the file was stored
+        self.assertEqual(os.listdir(os.path.join(self.spool_dir, 'incoming')), [])
+
+    async def test_disconnect_discards_partial_upload(self):
+        body = self.multipart(b'x' * 100000)
+        communicator = self.communicator(body)
+
+        await communicator.send_input({'type': 'http.request', 'body': body[:50000], 'more_body': True})
+        await communicator.send_input({'type': 'http.disconnect'})
+        response_start = await communicator.receive_output(timeout=5)
+
+        self.assertEqual(response_start['status'], 400)
+        self.assertEqual(os.listdir(os.path.join(self.spool_dir, 'incoming')), [])
+
+    def tearDown(self):
+        self.spool_settings.disable()
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
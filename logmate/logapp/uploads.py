@@ -0,0 +1,307 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import uuid
+
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+logger = logging.getLogger(__name__)
+
+CHUNK_READ_SIZE = 64 * 1024
+UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class StreamStats:
+    """Running size, SHA-256 and line count over a sequence of byte chunks."""
+
+    def __init__(self):
+        self.size = 0
+        self.digest = hashlib.sha256()
+        self.newlines = 0
+        self.last_byte = b'\n'
+
+    def update(self, data):
+        if not data:
+            return
+        self.size += len(data)
+        self.digest.update(data)
+        self.newlines += data.count(b'\n')
+        self.last_byte = data[-1:]
+
+    @property
+    def sha256(self):
+        return self.digest.hexdigest()
+
+    @property
+    def line_count(self):
+        # Trailing line without a newline still counts, as with readlines()
+        if self.size and self.last_byte != b'\n':
+            return self.newlines + 1
+        return self.newlines
+
+
+class StreamedUpload:
+    """
+    An uploaded log file that has already been written to its final location.
+
+    Stands in for Django's UploadedFile in request.FILES so the view never has
+    to copy the data a second time.
+    """
+
+    def __init__(self, name, path, size, sha256, line_count, content_type=None):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.line_count = line_count
+        self.content_type = content_type
+
+    def __repr__(self):
+        return f"<StreamedUpload: {self.name} ({self.size} bytes)>"
+
+
+class StreamingLogUploadHandler(FileUploadHandler):
+    """
+    Upload handler that streams the uploaded log file directly into dest_dir.
+
+    Only the file_field form field is kept; any other file in the body is
+    skipped rather than written. The file gets a unique name in dest_dir,
+    so concurrent uploads of the same file name never collide; the original
+    name is kept on the StreamedUpload. If upload_id is given, the first file
+    is written to <upload_id>.part so it matches its spool reservation.
+    Size, SHA-256 and line count are computed from the raw chunks as they
+    arrive. Under logmate.asgi the chunks come straight off the socket (see
+    logapp.streaming), so the body is written to disk exactly once.
+    """
+
+    # Larger than Django's 64 KB default so each read from a streamed body
+    # (one hop to the event loop) moves a meaningful amount of data
+    chunk_size = 1024 * 1024
+    file_field = 'log_file'
+
+    def __init__(self, dest_dir, request=None, upload_id=None):
+        super().__init__(request)
+        self.dest_dir = dest_dir
+        self.upload_id = upload_id
+        self.destination = None
+
+    def new_file(self, field_name, *args, **kwargs):
+        if field_name != self.file_field:
+            raise SkipFile()
+        super().new_file(field_name, *args, **kwargs)
+        upload_id, self.upload_id = self.upload_id or uuid.uuid4().hex, None
+        self.file_path = os.path.join(self.dest_dir, f"{upload_id}.part")
+        self.destination = open(self.file_path, 'wb')
+        self.stats = StreamStats()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.destination.write(raw_data)
+        self.stats.update(raw_data)
+        # Returning None stops the chunk from reaching any later handlers
+        return None
+
+    def file_complete(self, file_size):
+        self.destination.close()
+        self.destination = None
+        return StreamedUpload(
+            name=self.file_name,
+            path=self.file_path,
+            size=file_size,
+            sha256=self.stats.sha256,
+            line_count=self.stats.line_count,
+            content_type=self.content_type,
+        )
+
+    def upload_interrupted(self):
+        if self.destination is not None:
+            self.destination.close()
+            self.destination = None
+            try:
+                os.remove(self.file_path)
+            except OSError:
+                logger.warning(f"Could not remove partial upload {self.file_path}")
+
+
+class ChunkedUploadError(Exception):
+    """Raised when a chunked upload request cannot be applied."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class ChunkedUpload:
+    """
+    A resumable upload assembled from sequential appends.
+
+    The server-side offset is simply the size of the .part file, so it
+    survives dropped connections and process restarts. Metadata lives in a
+    JSON sidecar next to it. Once finalized, the sidecar is replaced by a
+    .done marker holding the result, so a repeated finalize (e.g. after a
+    lost response) returns the same result instead of failing.
+    """
+
+    def __init__(self, upload_id, file_name, file_size, base_dir, result=None):
+        self.upload_id = upload_id
+        self.file_name = file_name
+        self.file_size = file_size
+        self.base_dir = base_dir
+        self.result = result
+
+    @property
+    def part_path(self):
+        return os.path.join(self.base_dir, f"{self.upload_id}.part")
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.base_dir, f"{self.upload_id}.json")
+
+    @property
+    def done_path(self):
+        return os.path.join(self.base_dir, f"{self.upload_id}.done")
+
+    @property
+    def offset(self):
+        if self.result is not None:
+            return self.file_size
+        return os.path.getsize(self.part_path)
+
+    @classmethod
+    def create(cls, file_name, file_size, base_dir, upload_id=None):
+        os.makedirs(base_dir, exist_ok=True)
+        upload = cls(upload_id or uuid.uuid4().hex, os.path.basename(file_name), file_size, base_dir)
+        open(upload.part_path, 'wb').close()
+        with open(upload.meta_path, 'w') as f:
+            json.dump({'file_name': upload.file_name, 'file_size': file_size}, f)
+        return upload
+
+    @classmethod
+    def load(cls, upload_id, base_dir):
+        if not UPLOAD_ID_RE.match(upload_id):
+            raise ChunkedUploadError('Unknown upload', status=404)
+        for suffix in ('json', 'done'):
+            try:
+                with open(os.path.join(base_dir, f"{upload_id}.{suffix}")) as f:
+                    meta = json.load(f)
+                break
+            except FileNotFoundError:
+                continue
+        else:
+            raise ChunkedUploadError('Unknown upload', status=404)
+        return cls(upload_id, meta['file_name'], meta['file_size'], base_dir, meta.get('result'))
+
+    def _read_result(self):
+        try:
+            with open(self.done_path) as f:
+                return json.load(f)['result']
+        except FileNotFoundError:
+            return None
+
+    def _open_part(self, mode):
+        """Open and flock the .part file, refusing uploads that were already finalized."""
+        try:
+            part = open(self.part_path, mode)
+        except FileNotFoundError:
+            if self._read_result() is not None:
+                raise ChunkedUploadError('Upload already finalized', status=409, offset=self.file_size)
+            raise ChunkedUploadError('Unknown upload', status=404)
+        # Serialize appends and finalize on the same upload
+        fcntl.flock(part, fcntl.LOCK_EX)
+        # A finalize that held the lock first may have moved this file away
+        if self._read_result() is not None:
+            part.close()
+            raise ChunkedUploadError('Upload already finalized', status=409, offset=self.file_size)
+        return part
+
+    def append(self, offset, stream, length=None):
+        """
+        Append the bytes read from stream at the given offset.
+
+        The offset must equal the current server-side offset, otherwise a
+        409 error carrying the real offset is raised so the client can resume.
+        Returns the new offset.
+        """
+        # r+b rather than ab, so a finalized upload's .part is never recreated
+        with self._open_part('r+b') as destination:
+            current = os.fstat(destination.fileno()).st_size
+            destination.seek(current)
+            if offset != current:
+                raise ChunkedUploadError('Offset mismatch', status=409, offset=current)
+            if length is not None and current + length > self.file_size:
+                raise ChunkedUploadError('Chunk exceeds declared file size', offset=current)
+
+            written = 0
+            while True:
+                data = stream.read(CHUNK_READ_SIZE)
+                if not data:
+                    break
+                written += len(data)
+                if current + written > self.file_size:
+                    destination.truncate(current)
+                    raise ChunkedUploadError('Chunk exceeds declared file size', offset=current)
+                destination.write(data)
+            return current + written
+
+    def finalize(self, dest_path, on_complete):
+        """
+        Link the completed file to dest_path and hand it to on_complete.
+
+        on_complete receives the file as a StreamedUpload and returns a
+        JSON-serializable result, which is recorded in the .done marker and
+        returned. Finalizing an upload again returns the recorded result.
+        The .part file is only removed once on_complete has succeeded, so a
+        failed finalize can simply be retried.
+        """
+        if self.result is not None:
+            return self.result
+        try:
+            part = self._open_part('rb')
+        except ChunkedUploadError as e:
+            if e.status != 409:
+                raise
+            # Finalized since this upload was loaded
+            return self._read_result()
+
+        with part:
+            offset = os.fstat(part.fileno()).st_size
+            if offset != self.file_size:
+                raise ChunkedUploadError('Upload incomplete', status=409, offset=offset)
+
+            stats = StreamStats()
+            for data in iter(lambda: part.read(CHUNK_READ_SIZE), b''):
+                stats.update(data)
+
+            # A hard link, as on_complete may move or delete dest_path
+            os.link(self.part_path, dest_path)
+            try:
+                result = on_complete(StreamedUpload(
+                    name=self.file_name,
+                    path=dest_path,
+                    size=stats.size,
+                    sha256=stats.sha256,
+                    line_count=stats.line_count,
+                ))
+            except Exception:
+                if os.path.exists(dest_path):
+                    os.remove(dest_path)
+                raise
+
+            with open(self.done_path, 'w') as f:
+                json.dump({'file_name': self.file_name, 'file_size': self.file_size, 'result': result}, f)
+            os.remove(self.part_path)
+            os.remove(self.meta_path)
+            self.result = result
+            return result
+
+    def to_dict(self):
+        return {
+            'upload_id': self.upload_id,
+            'file_name': self.file_name,
+            'file_size': self.file_size,
+            'offset': self.offset,
+            'completed': self.result is not None,
+        }
@@ -1,51 +1,243 @@
-import os
-import tempfile
 import logging
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponseNotAllowed
+from django.middleware.csrf import CsrfViewMiddleware
+from django.core.exceptions import RequestAborted
 from .tasks import process_log
+from .uploads import StreamingLogUploadHandler, ChunkedUpload, ChunkedUploadError
+from .spool import UploadSpool, SpoolFull
+from .streaming import ExecutorBusy, get_upload_executor
 from django.middleware.csrf import get_token
 
 
 logger = logging.getLogger(__name__)
 
-def upload_log(request):
-    if request.method == 'POST':
+
+def _spool_full(error):
+    logger.warning(f"Rejecting upload: {error}")
+    response = JsonResponse({'error': 'Server is busy processing uploads, retry later'}, status=429)
+    response['Retry-After'] = '30'
+    return response
+
+
+async def _receive_body(func, *args):
+    """Run a view helper that reads the request body on the upload executor."""
+    try:
+        return await get_upload_executor().run(func, *args)
+    except ExecutorBusy:
+        logger.warning("Rejecting upload: all upload workers are busy")
+        response = JsonResponse({'error': 'Too many uploads in progress, retry later'}, status=503)
+        response['Retry-After'] = '5'
+        return response
+
+
+def _wants_profile(request):
+    """Profiling is opt-in per upload with ?profile=1."""
+    return request.GET.get('profile', '').lower() in ('1', 'true', 'yes')
+
+
+def _queue_processing(spool, log_file, profile=False):
+    """
+    Move a received upload into the spool and launch the Celery task for it.
+
+    Returns the response data.
+    """
+    file_path, deduplicated = spool.store(log_file.path, log_file.sha256)
+
+    # Launch Celery task as soon as the body is on disk
+    try:
+        task = process_log.delay(file_path, log_file.name, log_file.size, log_file.sha256, profile=profile)
+    except Exception:
+        # No task will ever release the reference store() took
+        spool.release(log_file.sha256)
+        raise
+
+    return {
+        'task_id': str(task.id),
+        'file_name': log_file.name,
+        'file_size': log_file.size,
+        'line_count': log_file.line_count,
+        'sha256': log_file.sha256,
+        'deduplicated': deduplicated,
+        'message': 'File uploaded. Processing in background.'
+    }
+
+
+def _receive_upload(request):
+    """
+    Stream the multipart body to disk and queue processing.
+
+    Runs on the upload executor (not Django's shared sync thread), so
+    concurrent uploads are written in parallel instead of queueing behind
+    each other, and slow uploads cannot starve the other views.
+    Under logmate.asgi the body is read from the socket here too, as the
+    multipart parser consumes it (see logapp.streaming).
+    """
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid Content-Length header'}, status=400)
+
+    handler = None
+    upload_id = None
+    try:
+        spool = UploadSpool()
+        try:
+            upload_id = spool.reserve(content_length)
+        except SpoolFull as e:
+            return _spool_full(e)
+        handler = StreamingLogUploadHandler(spool.incoming_dir, request, upload_id)
+        request.upload_handlers = [handler]
+
+        # CSRF is checked here rather than in the middleware, because the
+        # middleware would parse the body with the default upload handlers
+        # on the event loop's sync thread before the view ever ran.
+        rejection = CsrfViewMiddleware(lambda r: None).process_view(request, None, (), {})
+        if rejection is not None:
+            return rejection
+
         log_file = request.FILES.get('log_file')
         if not log_file:
             return JsonResponse({'error': 'No file uploaded'}, status=400)
 
-        try:
-            # Save file to /tmp or some safe path
-            temp_dir = tempfile.gettempdir()
-            os.makedirs(temp_dir, exist_ok=True)
-            file_path = os.path.join(temp_dir, log_file.name)
-            
-            # Save the uploaded file
-            with open(file_path, 'wb+') as destination:
-                for chunk in log_file.chunks():
-                    destination.write(chunk)
-
-            # Get file size for priority calculation
-            file_size = os.path.getsize(file_path)
-            logger.info(f"File {log_file.name} uploaded, size: {file_size} bytes")
-
-            # Launch Celery task with filename
-            task = process_log.delay(file_path, log_file.name, file_size)
-            
-            return JsonResponse({
-                'task_id': str(task.id),
-                'file_name': log_file.name,
-                'file_size': file_size,
-                'message': 'File uploaded. Processing in background.'
-            })
-
-        except Exception as e:
-            logger.error(f"Error processing log file: {e}", exc_info=True)
-            return JsonResponse({'error': f'Error processing file: {str(e)}'}, status=500)
+        logger.info(
+            f"File {log_file.name} uploaded, size: {log_file.size} bytes, "
+            f"lines: {log_file.line_count}, sha256: {log_file.sha256}"
+        )
+        return JsonResponse(_queue_processing(spool, log_file, _wants_profile(request)))
+
+    except RequestAborted:
+        logger.warning("Client disconnected during upload")
+        handler.upload_interrupted()
+        return JsonResponse({'error': 'Upload aborted'}, status=400)
+
+    except Exception as e:
+        logger.error(f"Error processing log file: {e}", exc_info=True)
+        if handler is not None:
+            handler.upload_interrupted()
+        return JsonResponse({'error': f'Error processing file: {str(e)}'}, status=500)
+
+    finally:
+        # Storing the file ends the reservation; otherwise drop it and any partial file
+        if upload_id is not None:
+            spool.discard(upload_id)
+
+
+async def upload_log(request):
+    if request.method == 'POST':
+        return await _receive_body(_receive_upload, request)
 
     return render(request, 'upload_form.html')
 
+# CSRF is enforced inside _receive_upload, after the streaming handler is installed
+upload_log.csrf_exempt = True
+
+
+def _chunked_error(error):
+    data = {'error': str(error)}
+    if error.offset is not None:
+        data['offset'] = error.offset
+    return JsonResponse(data, status=error.status)
+
+
+def _load_chunked_upload(upload_id):
+    return ChunkedUpload.load(upload_id, UploadSpool().chunked_dir)
+
+
+def _start_chunked_upload(request):
+    file_name = request.POST.get('file_name')
+    try:
+        file_size = int(request.POST.get('file_size', ''))
+    except ValueError:
+        file_size = -1
+    if not file_name or file_size < 0:
+        return JsonResponse({'error': 'file_name and file_size are required'}, status=400)
+
+    spool = UploadSpool()
+    try:
+        # The declared size stays reserved until the upload is finalized
+        upload_id = spool.reserve(file_size, spool.chunked_dir)
+    except SpoolFull as e:
+        return _spool_full(e)
+    upload = ChunkedUpload.create(file_name, file_size, spool.chunked_dir, upload_id)
+    logger.info(f"Chunked upload {upload.upload_id} started for {upload.file_name} ({file_size} bytes)")
+    return JsonResponse(upload.to_dict(), status=201)
+
+
+def _append_chunk(request, upload_id):
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Upload-Offset header is required'}, status=400)
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0) or None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid Content-Length header'}, status=400)
+
+    try:
+        upload = _load_chunked_upload(upload_id)
+        # Read the raw body stream, which is not subject to DATA_UPLOAD_MAX_MEMORY_SIZE
+        new_offset = upload.append(offset, request, length)
+    except ChunkedUploadError as e:
+        return _chunked_error(e)
+    return JsonResponse({'upload_id': upload_id, 'offset': new_offset})
+
+
+def _finalize_chunked_upload(request, upload_id):
+    spool = UploadSpool()
+
+    def queue(log_file):
+        logger.info(
+            f"Chunked upload {upload_id} complete: {log_file.name}, size: {log_file.size} bytes, "
+            f"lines: {log_file.line_count}, sha256: {log_file.sha256}"
+        )
+        return _queue_processing(spool, log_file, _wants_profile(request))
+
+    try:
+        upload = ChunkedUpload.load(upload_id, spool.chunked_dir)
+        # Finalizing again (e.g. after a lost response) returns the original task
+        result = upload.finalize(spool.incoming_path(), queue)
+    except ChunkedUploadError as e:
+        return _chunked_error(e)
+    except Exception as e:
+        # The upload is left as it was, so the client can finalize again
+        logger.error(f"Error finalizing chunked upload {upload_id}: {e}", exc_info=True)
+        return JsonResponse({'error': f'Error processing file: {str(e)}'}, status=500)
+    return JsonResponse(result)
+
+
+async def chunked_upload_init(request):
+    """Start a resumable upload. Expects file_name and file_size form fields."""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    return await sync_to_async(_start_chunked_upload, thread_sensitive=False)(request)
+
+
+async def chunked_upload_status(request, upload_id):
+    """Report the server-side offset so an interrupted client knows where to resume."""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    try:
+        upload = await sync_to_async(_load_chunked_upload, thread_sensitive=False)(upload_id)
+    except ChunkedUploadError as e:
+        return _chunked_error(e)
+    return JsonResponse(upload.to_dict())
+
+
+async def chunked_upload_append(request, upload_id):
+    """Append the raw request body at the offset given in the Upload-Offset header."""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    return await _receive_body(_append_chunk, request, upload_id)
+
+
+async def chunked_upload_finalize(request, upload_id):
+    """Verify the upload is complete and queue it for processing."""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    return await sync_to_async(_finalize_chunked_upload, thread_sensitive=False)(request, upload_id)
+
 
 def get_csrf_token(request):
     token = get_token(request)
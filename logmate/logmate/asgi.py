@@ -27,15 +27,16 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 import os
 import django
 from channels.routing import ProtocolTypeRouter, URLRouter
-from django.core.asgi import get_asgi_application
 from channels.auth import AuthMiddlewareStack
 import logapp.routing
+from logapp.streaming import StreamingUploadASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'logmate.settings')
 django.setup()
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    # Same as get_asgi_application(), but uploads stream instead of being pre-read
+    "http": StreamingUploadASGIHandler(),
     "websocket": AuthMiddlewareStack(
         URLRouter(
             logapp.routing.websocket_urlpatterns
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 from kombu import Exchange, Queue
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -148,6 +151,13 @@ CELERY_WORKER_POOL = 'solo' #this runs celery in a single process.
 # ASGI_APPLICATION = "myproject.asgi.application"
 ASGI_APPLICATION = "logmate.asgi.application"
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://redis:6379/1',
+    },
+}
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
@@ -158,6 +168,33 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Upload spool, shared by the backend and the workers (the shared_tmp volume)
+LOGMATE_SPOOL_DIR = os.path.join(tempfile.gettempdir(), 'logmate_spool')
+LOGMATE_SPOOL_QUOTA_BYTES = 5 * 1024 * 1024 * 1024
+# Incoming and chunked uploads idle for this long may be evicted
+LOGMATE_SPOOL_STALE_SECONDS = 24 * 60 * 60
+# How long finished results are cached by content hash
+LOGMATE_RESULT_CACHE_TIMEOUT = 24 * 60 * 60
+# Threads receiving upload bodies (multipart uploads and chunked appends).
+# Further uploads are answered with 503 while all of them are busy.
+LOGMATE_UPLOAD_WORKERS = 16
+
+# Collapse IDs, UUIDs and hashes in request paths before counting them.
+# Templates like '/api/v1/users/{id}/orders' take precedence over the
+# generic rules; each {placeholder} matches one path segment.
+LOGMATE_PATH_NORMALIZATION = True
+LOGMATE_PATH_TEMPLATES = []
+LOGMATE_PATH_CACHE_SIZE = 100000
+
+# Files at least this large get a sampled PREVIEW event before the exact pass;
+# the preview reads LOGMATE_PREVIEW_BLOCKS reads of LOGMATE_PREVIEW_BLOCK_SIZE bytes
+LOGMATE_PREVIEW_MIN_SIZE = 32 * 1024 * 1024
+LOGMATE_PREVIEW_BLOCKS = 32
+LOGMATE_PREVIEW_BLOCK_SIZE = 64 * 1024
+
+# How often live ingestion pushes sliding-window stats to dashboards, in seconds
+LOGMATE_LIVE_PUBLISH_INTERVAL = 1.0
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
 ]
@@ -166,6 +203,9 @@ CSRF_TRUSTED_ORIGINS = ['http://localhost:5173']
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Chunked uploads carry their resume position in this header
+CORS_ALLOW_HEADERS = (*default_headers, 'upload-offset')
+
 # Celery settings for concurrent task handling
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 minutes max runtime
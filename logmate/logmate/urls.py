@@ -16,11 +16,22 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from logapp.views import upload_log, get_csrf_token
+from logapp.views import (
+    upload_log,
+    get_csrf_token,
+    chunked_upload_init,
+    chunked_upload_status,
+    chunked_upload_append,
+    chunked_upload_finalize,
+)
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("upload/", upload_log, name='upload_log'),
+    path("upload/chunked/", chunked_upload_init, name='chunked_upload_init'),
+    path("upload/chunked/<str:upload_id>/", chunked_upload_status, name='chunked_upload_status'),
+    path("upload/chunked/<str:upload_id>/append/", chunked_upload_append, name='chunked_upload_append'),
+    path("upload/chunked/<str:upload_id>/finalize/", chunked_upload_finalize, name='chunked_upload_finalize'),
     path("csrf-token/", get_csrf_token, name='get_csrf_token'),
     path('', include('django_prometheus.urls')),  # This will add the /metrics endpoint
 ]
\ No newline at end of file